@@ -0,0 +1,217 @@
+# admin.py
+import csv
+import hmac
+import io
+import json
+from functools import wraps
+from typing import Optional
+
+from flask import Response, abort, jsonify, request, stream_with_context
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, BOOKING_EXPORT_COLUMNS, Booking, BookingRollup, Client, isoformat
+
+MAX_PAGE = 200
+
+
+# Поля брони в ответах API (_booking_dict и архивные строки)
+BOOKING_FIELDS = (
+    "id", "client_id", "name", "phone", "duration", "station", "start_at", "end_at", "created_at",
+)
+
+
+def bearer_token_valid(token: str) -> bool:
+    """Заголовок `Authorization: Bearer <token>` текущего запроса совпадает с token"""
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _booking_dict(booking: Booking) -> dict:
+    return {
+        "id": booking.id,
+        "client_id": booking.client_id,
+        "name": booking.name,
+        "phone": booking.phone,
+        "duration": booking.duration,
+        "station": booking.station,
+        "start_at": isoformat(booking.start_at),
+        "end_at": isoformat(booking.end_at),
+        "created_at": isoformat(booking.created_at),
+    }
+
+
+class AdminReports:
+    """JSON-отчёты для админки: /admin/api/...
+
+    Доступ по токену ADMIN_TOKEN (заголовок `Authorization: Bearer <токен>`);
+    без токена в окружении эндпоинты отключены. Списки пагинируются по
+    ключу (параметры after/before), а не OFFSET — стоимость страницы не
+    растёт с номером.
+    """
+
+    def __init__(self, app, token: Optional[str], archive=None):
+        self.token = token
+        self.archive = archive
+        for rule, name, view in (
+            ("/admin/api/clients", "admin_clients", self.clients),
+            ("/admin/api/clients/<int:client_id>/history", "admin_client_history", self.history),
+            ("/admin/api/bookings", "admin_bookings", self.bookings),
+            ("/admin/api/bookings/export", "admin_export", self.export),
+            ("/admin/api/rollups", "admin_rollups", self.rollups),
+        ):
+            app.add_url_rule(rule, name, self._protected(view))
+
+    def _protected(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.token:
+                abort(404)
+            if not bearer_token_valid(self.token):
+                return jsonify({"error": "unauthorized"}), 401
+            return view(*args, **kwargs)
+        return wrapper
+
+    @staticmethod
+    def _limit() -> int:
+        return min(max(request.args.get("limit", 50, type=int), 1), MAX_PAGE)
+
+    # -------------------------------------------------
+
+    def clients(self):
+        """Клиенты по возрастанию id вместе с бронями (один доп. запрос на страницу)"""
+        limit = self._limit()
+        query = Client.query.options(selectinload(Client.bookings)).order_by(Client.id)
+        after = request.args.get("after", type=int)
+        if after is not None:
+            query = query.filter(Client.id > after)
+        page = query.limit(limit).all()
+
+        return jsonify({
+            "items": [
+                {
+                    "id": client.id,
+                    "name": client.name,
+                    "phone": client.phone_e164,
+                    "first_booking_date": isoformat(client.first_booking_date),
+                    "last_booking_date": isoformat(client.last_booking_date),
+                    "bookings_count": client.bookings_count,
+                    "bookings": [_booking_dict(b) for b in client.bookings],
+                }
+                for client in page
+            ],
+            "next_after": page[-1].id if len(page) == limit else None,
+        })
+
+    def history(self, client_id: int):
+        """Вся история клиента: брони из БД и из архива, по времени сеанса"""
+        client = db.session.get(Client, client_id)
+        if client is None:
+            return jsonify({"error": "not found"}), 404
+
+        items = [dict(_booking_dict(b), archived=False) for b in client.bookings]
+        if self.archive is not None:
+            hot = {item["id"] for item in items}
+            items.extend(
+                dict({k: row[k] for k in BOOKING_FIELDS}, archived=True)
+                for row in self.archive.client_history(client_id)
+                if row["id"] not in hot
+            )
+        items.sort(key=lambda item: item["start_at"] or "")
+
+        return jsonify({
+            "id": client.id,
+            "name": client.name,
+            "phone": client.phone_e164,
+            "first_booking_date": isoformat(client.first_booking_date),
+            "last_booking_date": isoformat(client.last_booking_date),
+            "bookings_count": client.bookings_count,
+            "items": items,
+        })
+
+    def bookings(self):
+        """Брони от новых к старым; клиент подгружается JOIN-ом"""
+        limit = self._limit()
+        query = Booking.query.options(joinedload(Booking.client)).order_by(Booking.id.desc())
+        before = request.args.get("before", type=int)
+        if before is not None:
+            query = query.filter(Booking.id < before)
+        page = query.limit(limit).all()
+
+        items = []
+        for booking in page:
+            item = _booking_dict(booking)
+            item["client_phone"] = booking.client.phone_e164 if booking.client else None
+            items.append(item)
+        return jsonify({
+            "items": items,
+            "next_before": page[-1].id if len(page) == limit else None,
+        })
+
+    def export(self):
+        """Потоковая выгрузка всех броней: ?format=csv (по умолчанию) или jsonl"""
+        fmt = request.args.get("format", "csv")
+        if fmt not in ("csv", "jsonl"):
+            return jsonify({"error": "format: csv или jsonl"}), 400
+
+        columns = [Booking.__table__.c[name] for name in BOOKING_EXPORT_COLUMNS]
+        query = (
+            db.select(*columns)
+            .order_by(Booking.id)
+            .execution_options(yield_per=1000)
+        )
+
+        def rows():
+            # Курсор читается пачками по yield_per строк, таблица целиком в память не грузится
+            result = db.session.execute(query)
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(BOOKING_EXPORT_COLUMNS)
+                for row in result:
+                    writer.writerow(row)
+                    if buffer.tell() > 64 * 1024:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                for row in result:
+                    yield json.dumps(
+                        {k: isoformat(v) for k, v in row._mapping.items()},
+                        ensure_ascii=False,
+                    ) + "\n"
+
+        mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        response = Response(stream_with_context(rows()), mimetype=mimetype)
+        response.headers["Content-Disposition"] = f"attachment; filename=bookings.{fmt}"
+        return response
+
+    def rollups(self):
+        """Предагрегаты за период: ?from=YYYY-MM-DD&to=YYYY-MM-DD"""
+        query = BookingRollup.query.order_by(
+            BookingRollup.day, BookingRollup.hour, BookingRollup.tariff
+        )
+        try:
+            if request.args.get("from"):
+                query = query.filter(
+                    BookingRollup.day >= datetime.strptime(request.args["from"], "%Y-%m-%d").date()
+                )
+            if request.args.get("to"):
+                query = query.filter(
+                    BookingRollup.day <= datetime.strptime(request.args["to"], "%Y-%m-%d").date()
+                )
+        except ValueError:
+            return jsonify({"error": "Даты в формате YYYY-MM-DD"}), 400
+
+        return jsonify({
+            "items": [
+                {
+                    "day": r.day.isoformat(),
+                    "hour": r.hour,
+                    "tariff": r.tariff,
+                    "bookings": r.bookings,
+                    "revenue": r.revenue,
+                }
+                for r in query
+            ]
+        })
@@ -0,0 +1,141 @@
+# admission.py
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from metrics import REGISTRY
+from models import db, AdmissionThrottle, begin_immediate
+from scheduler import burst_allowance
+
+# Ключ идемпотентности из формы: случайная строка, сгенерированная браузером
+IDEMPOTENCY_KEY_RE = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+ADMISSION_REJECTED = REGISTRY.counter(
+    "vrzone_booking_rejected",
+    "Заявки, отклонённые лимитом до обращения к БД",
+    labels=("scope",),
+)
+IDEMPOTENT_REPLAYS = REGISTRY.counter(
+    "vrzone_booking_replays",
+    "Повторы заявки с уже обработанным ключом идемпотентности",
+)
+
+
+def parse_limit(value: Optional[str], default: str) -> Optional[Tuple[int, float]]:
+    """'5/60' -> (5, 60.0): не больше 5 заявок за 60 секунд. '0' отключает лимит"""
+    value = (value or default).strip()
+    if value == "0":
+        return None
+    try:
+        count, per = value.split("/")
+        count, per = int(count), float(per)
+    except ValueError:
+        raise RuntimeError(f"Лимит должен быть в формате N/секунды, получено: '{value}'")
+    if count <= 0 or per <= 0:
+        raise RuntimeError(f"Лимит должен быть положительным, получено: '{value}'")
+    return count, per
+
+
+class AdmissionLimiter:
+    """Лимит заявок на ключ (IP, телефон): `limit` заявок за `per` секунд.
+
+    Состояние — строки AdmissionThrottle (GCRA, как лимит чатов в
+    outbox), обновляемые под BEGIN IMMEDIATE, поэтому лимит общий для
+    всех воркеров gunicorn, а не умножается на их число. Истёкшие
+    строки удаляются не чаще раза в `per` секунд. Вызывать внутри app
+    context.
+    """
+
+    def __init__(self, scope: str, limit: int, per: float):
+        self.scope = scope
+        self.interval = timedelta(seconds=per / limit)
+        self.burst = timedelta(seconds=burst_allowance(limit / per, limit))
+        self.prune_interval = per
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def admit(self, key: str) -> float:
+        """0 — заявка принята; иначе сколько секунд ждать следующей"""
+        key = f"{self.scope}:{key}"
+        self._maybe_prune()
+
+        begin_immediate()
+        current = datetime.utcnow()
+        allowed_at = db.session.scalar(
+            db.select(AdmissionThrottle.allowed_at).where(AdmissionThrottle.key == key)
+        )
+        allowed_at = max(allowed_at or current, current)
+        if allowed_at - self.burst > current:
+            db.session.rollback()
+            return (allowed_at - self.burst - current).total_seconds()
+
+        stmt = sqlite_insert(AdmissionThrottle).values(key=key, allowed_at=allowed_at + self.interval)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[AdmissionThrottle.key],
+                set_={"allowed_at": stmt.excluded.allowed_at},
+            )
+        )
+        db.session.commit()
+        return 0.0
+
+    def _maybe_prune(self) -> None:
+        with self._lock:
+            if time.monotonic() < self._next_prune:
+                return
+            self._next_prune = time.monotonic() + self.prune_interval
+        begin_immediate()
+        db.session.execute(
+            db.delete(AdmissionThrottle).where(
+                AdmissionThrottle.key.startswith(f"{self.scope}:"),
+                AdmissionThrottle.allowed_at < datetime.utcnow(),
+            )
+        )
+        db.session.commit()
+
+
+class IdempotencyCache:
+    """Результаты обработанных заявок по ключу идемпотентности (TTL + LRU).
+
+    Повтор с тем же ключом (двойной клик, повторная отправка формы
+    браузером) получает сохранённый результат без обращения к БД.
+    """
+
+    def __init__(self, ttl: float = 600.0, max_keys: int = 10_000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._results: "OrderedDict[str, Tuple[float, tuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def valid_key(key) -> Optional[str]:
+        # Из JSON может прийти что угодно, не только строка
+        return key if isinstance(key, str) and IDEMPOTENCY_KEY_RE.fullmatch(key) else None
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            expires, result = entry
+            if expires < time.monotonic():
+                del self._results[key]
+                return None
+            return result
+
+    def put(self, key: str, result: tuple) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._results.pop(key, None)
+            self._results[key] = (now + self.ttl, result)
+            # Записи добавляются с одинаковым TTL, поэтому истёкшие — в начале
+            while self._results:
+                expires, _ = next(iter(self._results.values()))
+                if expires >= now and len(self._results) <= self.max_keys:
+                    break
+                self._results.popitem(last=False)
@@ -1,12 +1,34 @@
 # app.py
+import math
+import os
+import threading
+from html import escape
+from typing import Dict, NamedTuple, Optional
+
+from admission import IDEMPOTENT_REPLAYS
 from core import VRZoneBaseApp
-from flask import render_template, request, redirect, url_for, flash
-from models import db, Client, Booking
-from datetime import datetime
-# app.py
-from core import VRZoneBaseApp
-vr_app = VRZoneBaseApp()
-app = vr_app.app
+from flask import Flask, request, redirect, url_for, flash, jsonify
+from models import db, Client, Booking, BookingRollup, begin_immediate
+from datetime import datetime, timedelta
+
+class BookingOutcome(NamedTuple):
+    """Результат заявки: HTTP-статус для API, текст для пользователя, ошибки по полям"""
+
+    status: int
+    message: str
+    errors: Optional[Dict[str, str]] = None
+    retry_after: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+
+BOOKING_CREATED = BookingOutcome(201, "Запись успешно создана! Скоро с вами свяжутся.")
+SLOT_TAKEN = BookingOutcome(
+    409, "Это время уже занято, выберите другое.", {"time": "Это время уже занято"}
+)
+
 
 class VRZoneApp(VRZoneBaseApp):
     """Конкретная реализация приложения VR Zone"""
@@ -18,79 +40,220 @@ class VRZoneApp(VRZoneBaseApp):
     def _register_routes(self):
         @self.app.route("/")
         def index():
-            return render_template("index.html")
+            return self.page_cache.render("index.html")
 
         @self.app.route("/prices")
         def prices():
-            return render_template("prices.html")
+            return self.page_cache.render("prices.html")
 
         @self.app.route("/games")
         def games():
-            return render_template("games.html")
+            return self.page_cache.render("games.html")
 
         @self.app.route("/about")
         def about():
-            return render_template("about.html")
+            return self.page_cache.render("about.html")
 
         @self.app.route("/equipment")
         def equipment():
-            return render_template("equipment.html")
+            return self.page_cache.render("equipment.html")
+
+        @self.app.route("/availability")
+        def availability():
+            try:
+                day_from = datetime.strptime(request.args.get("date", ""), "%Y-%m-%d").date()
+            except ValueError:
+                return jsonify({"error": "Параметр date должен быть в формате YYYY-MM-DD"}), 400
+            days = min(max(request.args.get("days", 1, type=int), 1), 31)
+            minutes = self.availability.duration_minutes(request.args.get("duration", ""))
+
+            slots = self.availability.free_slots(day_from, day_from + timedelta(days=days - 1), minutes)
+            return jsonify({
+                "slots": [
+                    {
+                        "start": slot["start"].strftime("%Y-%m-%dT%H:%M"),
+                        "end": slot["end"].strftime("%Y-%m-%dT%H:%M"),
+                        "stations": slot["stations"],
+                    }
+                    for slot in slots
+                ]
+            })
 
         @self.app.route("/book", methods=["POST"])
         def book():
-            name    = request.form.get("name", "").strip()
-            phone   = request.form.get("phone", "").strip()
-            date    = request.form.get("date", "").strip()
-            time_   = request.form.get("time", "").strip()
-            selection = request.form.get("duration") or request.form.get("game") or "Не выбрано"
+            """Форма без JavaScript: результат через flash и редирект обратно"""
+            outcome = self._submit_booking(request.form)
+            flash(outcome.message, "success" if outcome.ok else "error")
+            return redirect(url_for("index") + "#booking")
 
-            is_valid, msg = self.validate_booking_data(name, phone, date, time_)
-            if not is_valid:
-                flash(msg, "error")
-                return redirect(url_for("index") + "#booking")
+        @self.app.route("/api/bookings", methods=["POST"])
+        def api_bookings():
+            """То же бронирование для fetch: короткий JSON вместо редиректа и страницы"""
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                data = request.form
+            # Поля формы — строки; JSON-числа приводятся к строке, остальное
+            # (true/false, null, списки, объекты) — ошибка: bool — подкласс int
+            invalid = {
+                k: "Неверный формат" for k, v in data.items()
+                if isinstance(v, bool) or not isinstance(v, (str, int, float))
+            }
+            if invalid:
+                outcome = BookingOutcome(422, "Неверный формат заявки", invalid)
+            else:
+                outcome = self._submit_booking(data, request.headers.get("Idempotency-Key"))
 
-            try:
-                with self.app.app_context():
-                    client = Client.query.filter_by(phone=phone).first()
-                    if not client:
-                        client = Client(name=name, phone=phone)
-                        db.session.add(client)
-                        db.session.flush()
-                    
-                    if client.name != name:
-                        client.name = name
-
-                    booking = Booking(
-                        client_id=client.id,
-                        name=name,
-                        phone=phone,
-                        date=date,
-                        time=time_,
-                        duration=selection
-                    )
-                    db.session.add(booking)
-                    db.session.commit()
+            body = {"ok": outcome.ok, "message": outcome.message}
+            if outcome.errors:
+                body["errors"] = outcome.errors
+            response = jsonify(body)
+            response.status_code = outcome.status
+            if outcome.retry_after:
+                response.headers["Retry-After"] = str(outcome.retry_after)
+            return response
+
+    # -------------------------------------------------
+    # Бронирование
+
+    def _submit_booking(self, data, idempotency_key: Optional[str] = None) -> "BookingOutcome":
+        """Проверяет и сохраняет заявку; общая часть /book и /api/bookings"""
+        # Повтор той же формы (двойной клик, повторная отправка) — прежний ответ без БД
+        key = self.idempotency.valid_key(idempotency_key or data.get("idempotency_key"))
+        if key:
+            replay = self.idempotency.get(key)
+            if replay is not None:
+                IDEMPOTENT_REPLAYS.inc()
+                return replay
+
+        name    = str(data.get("name") or "").strip()
+        phone   = str(data.get("phone") or "").strip()
+        date    = str(data.get("date") or "").strip()
+        time_   = str(data.get("time") or "").strip()
+        selection = str(data.get("duration") or data.get("game") or "Не выбрано").strip()
+
+        is_valid, msg = self.validate_booking_data(name, phone, date, time_)
+        if not is_valid:
+            return BookingOutcome(422, msg, self.booking_field_errors(name, phone, date, time_))
+
+        try:
+            start_at, end_at = self.availability.parse_slot(date, time_, selection)
+        except ValueError:
+            return BookingOutcome(422, "Неверная дата или время", {"date": "Неверная дата или время"})
 
-                # Уведомление админу
+        phone_e164 = self.normalize_phone(phone)
+        wait = self.admit_booking(request.remote_addr, phone_e164)
+        if wait:
+            return BookingOutcome(
+                429,
+                f"Слишком много заявок. Попробуйте через {max(1, math.ceil(wait / 60))} мин.",
+                retry_after=math.ceil(wait),
+            )
+
+        try:
+            with self.app.app_context():
+                begin_immediate()
+
+                # Повтор, попавший в другой воркер: бронь с этим ключом уже есть
+                if key and db.session.scalar(
+                    db.select(Booking.id).where(Booking.idempotency_key == key)
+                ):
+                    db.session.rollback()
+                    return self._remember(key, BOOKING_CREATED)
+
+                client_id, client_chat = Client.upsert(name, phone, phone_e164)
+
+                station = self.availability.pick_station(start_at, end_at)
+                if station is None:
+                    db.session.rollback()
+                    return self._remember(key, SLOT_TAKEN)
+
+                booking = Booking(
+                    client_id=client_id,
+                    name=name,
+                    phone=phone,
+                    date=date,
+                    time=time_,
+                    duration=selection,
+                    station=station,
+                    start_at=start_at,
+                    end_at=end_at,
+                    idempotency_key=key,
+                )
+                db.session.add(booking)
+
+                # Повторная проверка после INSERT: запись уже держит блокировку
+                # на запись, поэтому параллельная бронь не проскочит между ними
+                db.session.flush()
+                if self.availability.find_conflict(station, start_at, end_at, exclude_id=booking.id):
+                    db.session.rollback()
+                    return self._remember(key, SLOT_TAKEN)
+
+                BookingRollup.record(start_at, selection)
+
+                # Уведомление админу — в той же транзакции, отправка в фоне
+                # parse_mode=HTML: пользовательский ввод экранируем, иначе Telegram
+                # ответит 400 и уведомление уйдёт в dead
                 message = (
                     f"🚀 <b>Новая запись VR ZONE</b>\n\n"
-                    f"👤 {name}\n"
-                    f"📞 {phone}\n"
-                    f"📅 {date} в {time_}\n"
-                    f"🎮 {selection}\n"
-                    f"⏰ {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+                    f"👤 {escape(name)}\n"
+                    f"📞 {escape(phone)}\n"
+                    f"📅 {escape(date)} в {escape(time_)}\n"
+                    f"🎮 {escape(selection)}\n"
+                    f"⏰ {self.venue_now().strftime('%d.%m.%Y %H:%M')}"
                 )
-                self.send_telegram_message(message)
+                self.queue_telegram_message(message)
+
+                # Клиенту — если он привязал номер в нашем Telegram-боте
+                if client_chat:
+                    self.notifier.enqueue(
+                        client_chat,
+                        f"✅ <b>Заявка принята</b>\n\n"
+                        f"📅 {escape(date)} в {escape(time_)}\n"
+                        f"🎮 {escape(selection)}\n\n"
+                        f"Скоро мы свяжемся с вами для подтверждения.",
+                    )
+                db.session.commit()
 
-                flash("Запись успешно создана! Скоро с вами свяжутся.", "success")
-            
-            except Exception as e:
-                self.logger.error(f"Ошибка бронирования: {e}")
-                flash("Ошибка при сохранении. Попробуйте позже.", "error")
+            self.notifier.wake()
+            self.reminders.wake()
+            return self._remember(key, BOOKING_CREATED)
 
-            return redirect(url_for("index") + "#booking")
+        except Exception as e:
+            self.logger.error(f"Ошибка бронирования: {e}")
+            # Сбой не запоминаем: повтор с тем же ключом должен пройти заново
+            return BookingOutcome(500, "Ошибка при сохранении. Попробуйте позже.")
+
+    def _remember(self, key: Optional[str], outcome: "BookingOutcome") -> "BookingOutcome":
+        """Сохраняет окончательный ответ под ключом идемпотентности"""
+        if key:
+            self.idempotency.put(key, outcome)
+        return outcome
+
+
+_application: Optional[VRZoneApp] = None
+_application_lock = threading.Lock()
+
+
+def get_application() -> VRZoneApp:
+    """Единственный экземпляр приложения на процесс.
+
+    С `gunicorn --preload` создаётся один раз в мастере до fork, так что
+    create_all и миграции не выполняются в каждом воркере заново.
+    """
+    global _application
+    if _application is None:
+        with _application_lock:
+            if _application is None:
+                _application = VRZoneApp()
+    return _application
+
+
+def create_app() -> Flask:
+    """Фабрика для WSGI-серверов: `gunicorn -c gunicorn.conf.py "app:create_app()"`"""
+    return get_application().app
 
 
 if __name__ == "__main__":
-    application = VRZoneApp()
-    application.run(debug=True, port=5000)
\ No newline at end of file
+    # Dev-сервер; в продакшене — gunicorn (см. gunicorn.conf.py)
+    debug = os.getenv("FLASK_DEBUG", "0") == "1"
+    get_application().run(debug=debug, port=int(os.getenv("PORT", "5000")))
\ No newline at end of file
@@ -0,0 +1,202 @@
+# archive.py
+import argparse
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from models import db, BOOKING_EXPORT_COLUMNS, Booking, BookingReminder, begin_immediate, isoformat
+
+INDEX_FILE = "index.json"
+
+class BookingArchive:
+    """Архив старых броней: горячая SQLite остаётся маленькой.
+
+    Брони, начавшиеся раньше горизонта, переносятся в файлы
+    bookings-YYYY-MM.jsonl.gz (по месяцу начала сеанса). Файлы только
+    дописываются: каждый запуск добавляет новый gzip-член, который
+    читается как продолжение того же потока. Рядом лежит index.json —
+    число строк и клиенты каждого месяца, чтобы история клиента читала
+    только его месяцы.
+
+    Перенос запускается отдельно (например, раз в сутки по cron):
+    python archive.py --days 180 [--vacuum]
+    --vacuum после переноса сжимает файл БД (VACUUM): удалённые строки
+    иначе остаются свободными страницами, и файл не уменьшается. VACUUM
+    переписывает всю БД и на это время блокирует запись — запускайте
+    его в тихие часы.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._index: Optional[dict] = None
+        self._index_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _segment_path(self, month: str) -> str:
+        return os.path.join(self.directory, f"bookings-{month}.jsonl.gz")
+
+    # -------------------------------------------------
+    # Индекс
+
+    def index(self) -> dict:
+        """{"months": {"2025-01": {"rows", "min_id", "max_id", "clients"}}}; перечитывается при изменении файла"""
+        path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return {"months": {}}
+        with self._lock:
+            if self._index is None or mtime != self._index_mtime:
+                with open(path, encoding="utf-8") as f:
+                    self._index = json.load(f)
+                self._index_mtime = mtime
+            return self._index
+
+    def _write_index(self, index: dict) -> None:
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    # -------------------------------------------------
+    # Запись
+
+    def append(self, rows: Iterable[dict]) -> int:
+        """Дописывает строки в сегменты их месяцев и обновляет индекс"""
+        by_month: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_month.setdefault(row["start_at"][:7], []).append(row)
+        if not by_month:
+            return 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        index = json.loads(json.dumps(self.index()))
+        for month, month_rows in sorted(by_month.items()):
+            with open(self._segment_path(month), "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as segment:
+                    for row in month_rows:
+                        segment.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+                raw.flush()
+                os.fsync(raw.fileno())
+
+            entry = index["months"].setdefault(
+                month, {"rows": 0, "min_id": None, "max_id": None, "clients": []}
+            )
+            ids = [row["id"] for row in month_rows]
+            entry["rows"] += len(month_rows)
+            entry["min_id"] = min(filter(None, [entry["min_id"], *ids]))
+            entry["max_id"] = max(filter(None, [entry["max_id"], *ids]))
+            entry["clients"] = sorted(
+                set(entry["clients"]) | {row["client_id"] for row in month_rows if row["client_id"]}
+            )
+        self._write_index(index)
+        return sum(len(r) for r in by_month.values())
+
+    # -------------------------------------------------
+    # Чтение
+
+    def read_month(self, month: str) -> Iterable[dict]:
+        path = self._segment_path(month)
+        if not os.path.exists(path):
+            return
+        # gzip читает подряд все члены файла — и старые, и дописанные
+        with gzip.open(path, "rt", encoding="utf-8") as segment:
+            for line in segment:
+                yield json.loads(line)
+
+    def client_history(self, client_id: int) -> List[dict]:
+        """Архивные брони клиента; читаются только месяцы, где он есть в индексе"""
+        seen = {}
+        for month, entry in sorted(self.index()["months"].items()):
+            if client_id not in entry["clients"]:
+                continue
+            for row in self.read_month(month):
+                # Повтор после сбоя между записью сегмента и удалением из БД — берём один раз
+                if row["client_id"] == client_id:
+                    seen[row["id"]] = row
+        return sorted(seen.values(), key=lambda row: row["start_at"])
+
+    # -------------------------------------------------
+    # Перенос из БД
+
+    def archive_before(self, cutoff: datetime, batch_size: int = 5000) -> int:
+        """Переносит брони, начавшиеся раньше cutoff. Вызывать внутри app context.
+
+        Сначала сегмент записывается на диск, затем строки удаляются из
+        БД: сбой между шагами даст повтор в архиве (при чтении
+        отбрасывается), но не потерю брони.
+        """
+        booking = Booking.__table__
+        columns = [booking.c[name] for name in BOOKING_EXPORT_COLUMNS]
+        moved = 0
+        while True:
+            rows = db.session.execute(
+                db.select(*columns)
+                .where(booking.c.start_at.isnot(None), booking.c.start_at < cutoff)
+                .order_by(booking.c.start_at)
+                .limit(batch_size)
+            ).all()
+            db.session.commit()
+            if not rows:
+                return moved
+
+            self.append({k: isoformat(v) for k, v in row._mapping.items()} for row in rows)
+
+            ids = [row.id for row in rows]
+            begin_immediate()
+            db.session.execute(db.delete(BookingReminder).where(BookingReminder.booking_id.in_(ids)))
+            db.session.execute(db.delete(Booking).where(Booking.id.in_(ids)))
+            db.session.commit()
+            moved += len(ids)
+
+
+def vacuum(engine) -> None:
+    """VACUUM на «сыром» соединении драйвера.
+
+    Через Connection SQLAlchemy нельзя: обработчик "begin" (см.
+    VRZoneBaseApp._configure_sqlite) открывает транзакцию перед любым
+    запросом, а VACUUM внутри транзакции SQLite не выполняет. Неявный
+    BEGIN драйвера отключён (isolation_level=None), поэтому здесь
+    команда идёт вне транзакции.
+    """
+    connection = engine.raw_connection()
+    try:
+        connection.cursor().execute("VACUUM")
+    finally:
+        connection.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Перенос старых броней в архив")
+    parser.add_argument(
+        "--days", type=int, default=None,
+        help="архивировать брони старше N дней (по умолчанию ARCHIVE_AFTER_DAYS)",
+    )
+    parser.add_argument("--vacuum", action="store_true", help="сжать файл БД после переноса")
+    args = parser.parse_args(argv)
+
+    from app import get_application
+
+    application = get_application()
+    days = args.days if args.days is not None else application.archive_after_days
+    if days < 1:
+        parser.error("горизонт архива должен быть не меньше 1 дня")
+    # start_at — местное время площадки, а не часы контейнера (UTC)
+    cutoff = application.venue_now() - timedelta(days=days)
+    with application.app.app_context():
+        moved = application.archive.archive_before(cutoff)
+        application.logger.info(f"Архив: перенесено {moved} броней старше {cutoff:%Y-%m-%d}")
+        if args.vacuum and moved:
+            vacuum(db.engine)
+            application.logger.info("Архив: БД сжата (VACUUM)")
+    return moved
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# assets.py
+"""Сборка статики: хэшированные имена, минификация CSS, WebP/AVIF варианты.
+
+Запуск сборки (делается в Dockerfile):
+
+    python assets.py
+
+Результат пишется в static/dist вместе с manifest.json. Приложение
+читает манифест при старте и отдаёт файлы из /assets/ с
+Cache-Control: immutable. Без манифеста всё работает по-старому
+через /static/.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import re
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+from flask import send_from_directory, url_for
+
+try:
+    from PIL import Image, features
+except ImportError:  # Pillow нужен только для сборки вариантов картинок
+    Image = None
+
+logger = logging.getLogger("VRZone.assets")
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+IMAGE_WIDTHS = (480, 800, 1200)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+# -------------------------------------------------
+# Сборка
+
+
+class AssetBuilder:
+    """Собирает static/ в static/dist/ и пишет манифест"""
+
+    def __init__(self, static_folder: str):
+        self.static_folder = static_folder
+        self.dist = os.path.join(static_folder, DIST_DIR)
+        self.files: Dict[str, str] = {}
+        self.images: Dict[str, Dict[str, List[List]]] = {}
+
+    def build(self) -> dict:
+        if os.path.isdir(self.dist):
+            shutil.rmtree(self.dist)
+        os.makedirs(self.dist)
+
+        sources = sorted(self._sources())
+        # Картинки — первыми: CSS ссылается на их хэшированные имена
+        for path in sources:
+            if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+                self._build_image(path)
+        for path in sources:
+            if path.endswith(".css"):
+                self._build_css(path)
+
+        manifest = {"files": self.files, "images": self.images}
+        with open(os.path.join(self.dist, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        return manifest
+
+    def _sources(self):
+        for root, dirs, names in os.walk(self.static_folder):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != self.dist]
+            for name in names:
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, self.static_folder).replace(os.sep, "/")
+
+    def _write(self, path: str, data: bytes) -> str:
+        """Пишет файл с хэшем содержимого в имени, возвращает относительный путь"""
+        stem, ext = posixpath.splitext(path)
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        hashed = f"{stem}.{digest}{ext}"
+        target = os.path.join(self.dist, *hashed.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+        return hashed
+
+    # -------------------------------------------------
+    # Картинки
+
+    def _build_image(self, path: str) -> None:
+        with open(os.path.join(self.static_folder, path), "rb") as f:
+            self.files[path] = self._write(path, f.read())
+
+        if Image is None:
+            logger.warning("Pillow не установлен — варианты картинок не собраны")
+            return
+
+        stem = posixpath.splitext(path)[0]
+        variants: Dict[str, List[List]] = {}
+        with Image.open(os.path.join(self.static_folder, path)) as original:
+            original = original.convert("RGB")
+            widths = [w for w in IMAGE_WIDTHS if w < original.width] + [original.width]
+            for fmt, mime in (("avif", "image/avif"), ("webp", "image/webp")):
+                if not features.check(fmt):
+                    continue
+                for width in widths:
+                    height = round(original.height * width / original.width)
+                    resized = original.resize((width, height), Image.LANCZOS)
+                    data = self._encode(resized, fmt)
+                    hashed = self._write(f"{stem}-{width}.{fmt}", data)
+                    variants.setdefault(mime, []).append([width, hashed])
+        self.images[path] = variants
+
+    @staticmethod
+    def _encode(image, fmt: str) -> bytes:
+        buffer = io.BytesIO()
+        if fmt == "webp":
+            image.save(buffer, "WEBP", quality=80, method=6)
+        else:
+            image.save(buffer, "AVIF", quality=60)
+        return buffer.getvalue()
+
+    # -------------------------------------------------
+    # CSS
+
+    _RULE_RE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+    _URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+    _BG_IMAGE_RE = re.compile(r"""background-image\s*:\s*url\(\s*['"]?([^'")]+)['"]?\s*\)\s*;?""")
+
+    def _resolve(self, css_path: str, ref: str) -> Optional[str]:
+        if ref.startswith(("data:", "http://", "https://", "//")):
+            return None
+        if ref.startswith("/static/"):
+            return ref[len("/static/"):]
+        return posixpath.normpath(posixpath.join(posixpath.dirname(css_path), ref))
+
+    def _build_css(self, path: str) -> None:
+        with open(os.path.join(self.static_folder, path), encoding="utf-8") as f:
+            css = f.read()
+
+        css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+        css_dir = posixpath.dirname(path)
+
+        def relative(target: str) -> str:
+            return posixpath.relpath(target, css_dir)
+
+        def rewrite_rule(match):
+            selector, body = match.group(1), match.group(2)
+            extra = ""
+
+            bg = self._BG_IMAGE_RE.search(body)
+            source = self._resolve(path, bg.group(1)) if bg else None
+            variants = self.images.get(source) if source else None
+            if variants:
+                extra = self._image_set_rules(selector.strip(), source, variants, relative)
+
+            def rewrite_url(url_match):
+                source = self._resolve(path, url_match.group(2))
+                if source not in self.files:
+                    if source is not None:
+                        logger.warning(f"{path}: не найден файл {url_match.group(2)}")
+                    return url_match.group(0)
+                return f'url("{relative(self.files[source])}")'
+
+            return f"{selector}{{{self._URL_RE.sub(rewrite_url, body)}}}{extra}"
+
+        css = self._RULE_RE.sub(rewrite_rule, css)
+        self.files[path] = self._write(path, self.minify_css(css).encode("utf-8"))
+
+    def _image_set_rules(self, selector: str, source: str, variants: dict, relative) -> str:
+        """Правила image-set() для фоновой картинки: полный размер и меньшие
+        варианты под узкие экраны (ширина варианта / 2 — с расчётом на DPR 2).
+        Браузеры без image-set() остаются на исходном url()."""
+        fallback = relative(self.files[source])
+        widths = sorted({width for items in variants.values() for width, _ in items}, reverse=True)
+
+        def image_set(width: int) -> str:
+            options = [
+                f'url("{relative(hashed)}") type("{mime}")'
+                for mime, items in variants.items()
+                for w, hashed in items if w == width
+            ]
+            options.append(f'url("{fallback}") type("image/{self._mime_suffix(source)}")')
+            return f"background-image:image-set({','.join(options)})"
+
+        rules = [f"{selector}{{{image_set(widths[0])}}}"]
+        for width in widths[1:]:
+            rules.append(f"@media (max-width:{width // 2}px){{{selector}{{{image_set(width)}}}}}")
+        return "".join(rules)
+
+    @staticmethod
+    def _mime_suffix(path: str) -> str:
+        ext = posixpath.splitext(path)[1].lower().lstrip(".")
+        return "jpeg" if ext == "jpg" else ext
+
+    @staticmethod
+    def minify_css(css: str) -> str:
+        css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+        css = re.sub(r"\s+", " ", css)
+        css = re.sub(r"\s*([{}:;,>])\s*", r"\1", css)
+        css = css.replace(";}", "}")
+        return css.strip()
+
+
+# -------------------------------------------------
+# Runtime
+
+
+class AssetManifest:
+    """Отдаёт хэшированные URL для шаблонов и раздаёт /assets/ с immutable"""
+
+    def __init__(self, app=None):
+        self.files: Dict[str, str] = {}
+        self.images: Dict[str, Dict[str, List[List]]] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.dist = os.path.join(app.static_folder, DIST_DIR)
+        self.load()
+
+        app.add_url_rule("/assets/<path:filename>", "assets", self._serve)
+        app.jinja_env.globals["asset_url"] = self.url
+        app.jinja_env.globals["asset_srcset"] = self.srcset
+
+    def load(self) -> None:
+        try:
+            with open(os.path.join(self.dist, MANIFEST_NAME), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            self.files, self.images = {}, {}
+            return
+        self.files = manifest.get("files", {})
+        self.images = manifest.get("images", {})
+
+    def url(self, filename: str) -> str:
+        hashed = self.files.get(filename)
+        if hashed is None:
+            return url_for("static", filename=filename)
+        return url_for("assets", filename=hashed)
+
+    def srcset(self, filename: str, mime: str = "image/webp") -> str:
+        """Значение srcset для <source type=mime> из собранных вариантов"""
+        return ", ".join(
+            f"{url_for('assets', filename=hashed)} {width}w"
+            for width, hashed in self.images.get(filename, {}).get(mime, [])
+        )
+
+    def _serve(self, filename: str):
+        response = send_from_directory(self.dist, filename, max_age=IMMUTABLE_MAX_AGE)
+        response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        return response
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    result = AssetBuilder(folder).build()
+    logger.info(f"Собрано файлов: {len(result['files'])}, картинок с вариантами: {len(result['images'])}")
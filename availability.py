@@ -0,0 +1,205 @@
+# availability.py
+import re
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from models import db, Booking
+
+
+# Длительность тарифов в минутах (ключ — значение из формы бронирования)
+TARIFF_MINUTES = {
+    "30 минут": 30,
+    "60 минут": 60,
+    "Компания": 60,
+}
+DEFAULT_MINUTES = 60
+# Верхняя граница сеанса: задаёт окно поиска пересечений по индексу
+MAX_MINUTES = 240
+# Допустимые форматы времени из формы (<input type="time"> может прислать секунды)
+TIME_FORMATS = ("%H:%M", "%H:%M:%S")
+
+
+class AvailabilityEngine:
+    """Расчёт свободных слотов и проверка пересечений броней.
+
+    Все запросы идут по индексу (station, start_at) и ограничены окном
+    [начало - максимальная длительность, конец), поэтому стоимость не
+    зависит от размера истории.
+    """
+
+    def __init__(
+        self,
+        stations: int = 2,
+        open_time: time = time(10, 0),
+        close_time: time = time(22, 0),
+        slot_step: int = 30,
+    ):
+        self.stations = list(range(1, stations + 1))
+        self.open_time = open_time
+        self.close_time = close_time
+        self.slot_step = timedelta(minutes=slot_step)
+        self.max_duration = timedelta(minutes=MAX_MINUTES)
+
+    # -------------------------------------------------
+    # Разбор строковых полей
+
+    @staticmethod
+    def duration_minutes(selection: str) -> int:
+        if selection in TARIFF_MINUTES:
+            return TARIFF_MINUTES[selection]
+        match = re.match(r"\s*(\d+)", selection or "")
+        minutes = int(match.group(1)) if match else DEFAULT_MINUTES
+        return max(1, min(minutes, MAX_MINUTES))
+
+    @classmethod
+    def parse_slot(cls, date_: str, time_: str, selection: str) -> Tuple[datetime, datetime]:
+        """'2026-10-20', '18:30', '60 минут' -> (start, end). ValueError при мусоре.
+
+        Время разбирается целиком (HH:MM или HH:MM:SS): хвост вроде
+        '12:00<b>' — ошибка, а не 12:00.
+        """
+        day = datetime.strptime(date_.strip(), "%Y-%m-%d").date()
+        for fmt in TIME_FORMATS:
+            try:
+                clock = datetime.strptime(time_.strip(), fmt).time()
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Неверное время: {time_!r}")
+        start = datetime.combine(day, clock.replace(second=0))
+        return start, start + timedelta(minutes=cls.duration_minutes(selection))
+
+    # -------------------------------------------------
+    # Пересечения
+
+    def _overlapping(self, start: datetime, end: datetime, *columns):
+        # Ограничение снизу по start_at позволяет использовать индекс диапазоном.
+        # Core-запрос вместо Query: на горячем пути важна каждая доля миллисекунды
+        return db.select(*columns).where(
+            Booking.start_at < end,
+            Booking.start_at > start - self.max_duration,
+            Booking.end_at > start,
+        )
+
+    def find_conflict(
+        self,
+        station: int,
+        start: datetime,
+        end: datetime,
+        exclude_id: Optional[int] = None,
+    ) -> Optional[int]:
+        """id пересекающейся брони на станции или None"""
+        query = self._overlapping(start, end, Booking.id).where(Booking.station == station)
+        if exclude_id is not None:
+            query = query.where(Booking.id != exclude_id)
+        return db.session.execute(query.limit(1)).scalar()
+
+    def pick_station(
+        self,
+        start: datetime,
+        end: datetime,
+        exclude_id: Optional[int] = None,
+    ) -> Optional[int]:
+        """Первая станция, свободная на [start, end), или None"""
+        query = self._overlapping(start, end, Booking.station).where(
+            Booking.station.in_(self.stations)
+        )
+        if exclude_id is not None:
+            query = query.where(Booking.id != exclude_id)
+        busy = set(db.session.execute(query).scalars())
+        for station in self.stations:
+            if station not in busy:
+                return station
+        return None
+
+    # -------------------------------------------------
+    # Свободные слоты
+
+    def busy_intervals(self, start: datetime, end: datetime) -> Dict[int, List[Tuple[datetime, datetime]]]:
+        query = (
+            self._overlapping(start, end, Booking.station, Booking.start_at, Booking.end_at)
+            .where(Booking.station.in_(self.stations))
+            .order_by(Booking.station, Booking.start_at)
+        )
+        intervals = defaultdict(list)
+        for station, s, e in db.session.execute(query):
+            intervals[station].append((s, e))
+        return intervals
+
+    def free_slots(
+        self,
+        day_from: date,
+        day_to: date,
+        minutes: int = DEFAULT_MINUTES,
+    ) -> List[dict]:
+        """Свободные слоты длительностью `minutes` с day_from по day_to включительно.
+
+        Возвращает список {"start", "end", "stations"} только для слотов,
+        где свободна хотя бы одна станция.
+        """
+        length = timedelta(minutes=minutes)
+        range_start = datetime.combine(day_from, self.open_time)
+        range_end = datetime.combine(day_to, self.close_time)
+        intervals = self.busy_intervals(range_start, range_end)
+
+        # Слоты идут по возрастанию, интервалы станции отсортированы по start_at.
+        # Для каждой станции указатель проходит интервалы с началом до конца
+        # слота один раз и помнит самый поздний их конец: слот занят, если этот
+        # конец позже начала слота. Итого O(слоты + брони), а не их произведение.
+        cursor = dict.fromkeys(self.stations, 0)
+        reach = dict.fromkeys(self.stations, datetime.min)
+
+        slots = []
+        day = day_from
+        while day <= day_to:
+            slot = datetime.combine(day, self.open_time)
+            closing = datetime.combine(day, self.close_time)
+            while slot + length <= closing:
+                slot_end = slot + length
+                free = []
+                for station in self.stations:
+                    busy = intervals.get(station, ())
+                    i = cursor[station]
+                    while i < len(busy) and busy[i][0] < slot_end:
+                        reach[station] = max(reach[station], busy[i][1])
+                        i += 1
+                    cursor[station] = i
+                    if reach[station] <= slot:
+                        free.append(station)
+                if free:
+                    slots.append({"start": slot, "end": slot_end, "stations": free})
+                slot += self.slot_step
+            day += timedelta(days=1)
+        return slots
+
+    # -------------------------------------------------
+    # Миграция строковых полей
+
+    def backfill(self, batch_size: int = 500) -> int:
+        """Заполняет start_at/end_at/station для старых строковых записей.
+
+        Станция подбирается так, чтобы исторические пересечения по
+        возможности разошлись по разным станциям. Нераспознанные записи
+        остаются с start_at = NULL и в расчёте занятости не участвуют.
+        """
+        rows = (
+            Booking.query
+            .filter(Booking.start_at.is_(None))
+            .order_by(Booking.id)
+            .all()
+        )
+        updated = 0
+        for booking in rows:
+            try:
+                start, end = self.parse_slot(booking.date, booking.time, booking.duration)
+            except ValueError:
+                continue
+            booking.start_at, booking.end_at = start, end
+            booking.station = self.pick_station(start, end, exclude_id=booking.id) or self.stations[0]
+            updated += 1
+            if updated % batch_size == 0:
+                db.session.commit()
+        db.session.commit()
+        return updated
@@ -0,0 +1,401 @@
+# benchmark.py
+"""Нагрузочный тест пути бронирования.
+
+Поднимает приложение (gunicorn) на временной SQLite, подменяет Telegram
+API локальной заглушкой с настраиваемой задержкой и долей ошибок и
+гоняет смешанный трафик: GET пяти страниц и POST /api/bookings (или
+формы /book) с реалистичными и повторяющимися телефонами. Результат —
+JSON для сравнения прогонов:
+
+    python benchmark.py --workers 4 --concurrency 32 --duration 30 \\
+        --tg-latency 0.2 --tg-error-rate 0.05 --out bench/results.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PAGES = ["/", "/prices", "/games", "/about", "/equipment"]
+TARIFFS = ["30 минут", "60 минут", "Компания"]
+PHONE_FORMATS = [
+    "+7 7{a:02d} {b:03d} {c:02d} {d:02d}",
+    "87{a:02d}{b:03d}{c:02d}{d:02d}",
+    "7{a:02d}{b:03d}{c:02d}{d:02d}",
+    "8 (7{a:02d}) {b:03d}-{c:02d}-{d:02d}",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered) * 1000, 2),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+# -------------------------------------------------
+# Заглушка Telegram API
+
+
+class TelegramStub:
+    """Локальный sendMessage с задержкой, ошибками и учётом времени доставки"""
+
+    def __init__(self, latency: float, error_rate: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.delivered: Dict[str, float] = {}
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", free_port()), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                text = parse_qs(body).get("text", [""])[0]
+                time.sleep(stub.latency)
+
+                with stub._lock:
+                    stub.requests += 1
+                    failed = random.random() < stub.error_rate
+                    if failed:
+                        stub.errors += 1
+                    else:
+                        marker = re.search(r"bench-\d+-\d+", text)
+                        if marker and marker.group(0) not in stub.delivered:
+                            stub.delivered[marker.group(0)] = time.monotonic()
+
+                if failed:
+                    # Половина ошибок — 429 с retry_after, половина — 502
+                    if random.random() < 0.5:
+                        payload, status = {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}}, 429
+                    else:
+                        payload, status = {"ok": False, "error_code": 502}, 502
+                else:
+                    payload, status = {"ok": True, "result": {"message_id": 1}}, 200
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+# -------------------------------------------------
+# Приложение
+
+
+class AppServer:
+    """gunicorn с приложением на временной БД"""
+
+    def __init__(self, workers: int, threads: int, telegram_url: str, workdir: str):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.database_path = os.path.join(workdir, "bookings.db")
+        self.log_path = os.path.join(workdir, "server.log")
+        self.env = dict(os.environ)
+        # Все заявки идут с одного адреса — лимиты /book по умолчанию выключены
+        self.env.setdefault("BOOK_IP_LIMIT", "0")
+        self.env.setdefault("BOOK_PHONE_LIMIT", "0")
+        self.env.update(
+            BOT_TOKEN="bench:token",
+            CHAT_ID="1",
+            SECRET_KEY="bench",
+            DATABASE_PATH=self.database_path,
+            TELEGRAM_API_URL=telegram_url,
+            PORT=str(self.port),
+            WEB_CONCURRENCY=str(workers),
+            WEB_THREADS=str(threads),
+        )
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 30.0) -> None:
+        self._log = open(self.log_path, "wb")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:create_app()"],
+            cwd=ROOT,
+            env=self.env,
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(self.url + "/", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Сервер не поднялся, см. {self.log_path}")
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+
+    def log_count(self, pattern: str) -> int:
+        with open(self.log_path, encoding="utf-8", errors="replace") as f:
+            return sum(1 for line in f if pattern in line)
+
+
+# -------------------------------------------------
+# Нагрузка
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, args):
+        self.base_url = base_url
+        self.args = args
+        self.latencies: Dict[str, List[float]] = {"page": [], "book": []}
+        self.statuses: Dict[str, int] = {}
+        self.failures = 0
+        # Имя брони -> когда пришёл ответ; принята ли она, решает БД (stored_names)
+        self.submitted_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+        rng = random.Random(args.seed)
+        self.phone_pool = [self._phone(rng) for _ in range(args.phone_pool)]
+
+    @staticmethod
+    def _phone(rng: random.Random) -> str:
+        return rng.choice(PHONE_FORMATS).format(
+            a=rng.choice([0, 1, 2, 5, 7, 8]), b=rng.randrange(1000), c=rng.randrange(100), d=rng.randrange(100)
+        )
+
+    def _booking(self, rng: random.Random, worker: int) -> dict:
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        phone = rng.choice(self.phone_pool) if rng.random() < self.args.duplicate_ratio else self._phone(rng)
+        day = date.today() + timedelta(days=rng.randrange(1, self.args.days_ahead + 1))
+        return {
+            "name": f"bench-{worker}-{seq}",
+            "phone": phone,
+            "date": day.isoformat(),
+            "time": f"{rng.randrange(10, 21):02d}:{rng.choice(['00', '30'])}",
+            "duration": rng.choice(TARIFFS),
+        }
+
+    def _record(self, kind: str, elapsed: float, status: Optional[int]) -> None:
+        with self._lock:
+            self.latencies[kind].append(elapsed)
+            key = f"{kind}:{status}"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            if status is None or status >= 500:
+                self.failures += 1
+
+    def _worker(self, worker: int, deadline: float) -> None:
+        rng = random.Random(self.args.seed + worker)
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            if rng.random() < self.args.book_ratio:
+                form = self._booking(rng, worker)
+                started = time.perf_counter()
+                try:
+                    if self.args.form:
+                        r = session.post(self.base_url + "/book", data=form, allow_redirects=False, timeout=30)
+                    else:
+                        r = session.post(self.base_url + "/api/bookings", data=form, timeout=30)
+                    status = r.status_code
+                except requests.RequestException:
+                    status = None
+                self._record("book", time.perf_counter() - started, status)
+                # /book отвечает 302 и на отказ, поэтому принятые брони считаются по БД
+                if status is not None:
+                    with self._lock:
+                        self.submitted_at[form["name"]] = time.monotonic()
+            else:
+                started = time.perf_counter()
+                try:
+                    r = session.get(
+                        self.base_url + rng.choice(PAGES),
+                        headers={"Accept-Encoding": "gzip, br"},
+                        timeout=30,
+                    )
+                    status = r.status_code
+                except requests.RequestException:
+                    status = None
+                self._record("page", time.perf_counter() - started, status)
+
+    def run(self) -> float:
+        deadline = time.monotonic() + self.args.duration
+        started = time.monotonic()
+        with ThreadPoolExecutor(self.args.concurrency) as pool:
+            for i in range(self.args.concurrency):
+                pool.submit(self._worker, i, deadline)
+        return time.monotonic() - started
+
+
+# -------------------------------------------------
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stored_names(database_path: str) -> set:
+    """Имена броней из БД: у каждой заявки бенчмарка имя уникально"""
+    import sqlite3
+
+    with sqlite3.connect(database_path) as conn:
+        return {name for (name,) in conn.execute("SELECT name FROM booking WHERE name LIKE 'bench-%'")}
+
+
+def count_rows(database_path: str, table: str, where: str = "1=1") -> int:
+    import sqlite3
+
+    with sqlite3.connect(database_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}").fetchone()[0]
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест VR Zone")
+    parser.add_argument("--workers", type=int, default=2, help="процессы gunicorn")
+    parser.add_argument("--threads", type=int, default=4, help="потоки на процесс")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременные клиенты")
+    parser.add_argument("--duration", type=float, default=15.0, help="длительность, с")
+    parser.add_argument("--book-ratio", type=float, default=0.2, help="доля заявок на бронь")
+    parser.add_argument("--form", action="store_true", help="бронировать формой /book (302) вместо /api/bookings (201)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3, help="доля броней с повторным телефоном")
+    parser.add_argument("--phone-pool", type=int, default=50, help="размер пула повторяющихся телефонов")
+    parser.add_argument("--days-ahead", type=int, default=60, help="на сколько дней вперёд бронировать")
+    parser.add_argument("--tg-latency", type=float, default=0.1, help="задержка заглушки Telegram, с")
+    parser.add_argument("--tg-error-rate", type=float, default=0.0, help="доля ошибок Telegram")
+    parser.add_argument("--drain", type=float, default=15.0, help="сколько ждать доставки уведомлений, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None, help="файл для JSON-результата")
+    args = parser.parse_args(argv)
+
+    stub = TelegramStub(args.tg_latency, args.tg_error_rate)
+    stub.start()
+
+    with tempfile.TemporaryDirectory(prefix="vrzone-bench-") as workdir:
+        server = AppServer(args.workers, args.threads, stub.url, workdir)
+        server.start()
+        try:
+            load = LoadGenerator(server.url, args)
+            elapsed = load.run()
+            stored = stored_names(server.database_path)
+            booked_at = {name: at for name, at in load.submitted_at.items() if name in stored}
+
+            # Ждём, пока диспетчер дошлёт уведомления
+            deadline = time.monotonic() + args.drain
+            while time.monotonic() < deadline and len(stub.delivered) < len(booked_at):
+                time.sleep(0.2)
+        finally:
+            server.stop()
+        stub.stop()
+
+        lags = [
+            stub.delivered[name] - booked
+            for name, booked in booked_at.items()
+            if name in stub.delivered
+        ]
+        total = sum(len(v) for v in load.latencies.values())
+        result = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "config": vars(args),
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": {
+                "total": round(total / elapsed, 1),
+                "page": round(len(load.latencies["page"]) / elapsed, 1),
+                "book": round(len(load.latencies["book"]) / elapsed, 1),
+            },
+            "latency_ms": {kind: percentiles(values) for kind, values in load.latencies.items()},
+            "statuses": load.statuses,
+            "failures": load.failures,
+            "bookings": {
+                "submitted": len(load.latencies["book"]),
+                "accepted": len(booked_at),
+                # Отказы: занятый слот, ошибки валидации, лимиты, 5xx и обрывы
+                "rejected": len(load.latencies["book"]) - len(booked_at),
+                "rejected_by_status": {
+                    key.split(":", 1)[1]: count
+                    for key, count in load.statuses.items()
+                    if key.startswith("book:") and key not in ("book:201", "book:302")
+                },
+                "stored": count_rows(server.database_path, "booking"),
+                "clients": count_rows(server.database_path, "client"),
+                "outbox_pending": count_rows(server.database_path, "notification_outbox", "status = 'pending'"),
+                "outbox_dead": count_rows(server.database_path, "notification_outbox", "status = 'dead'"),
+            },
+            "sqlite_lock_errors": server.log_count("database is locked"),
+            "booking_errors": server.log_count("Ошибка бронирования"),
+            "notifications": {
+                "telegram_requests": stub.requests,
+                "telegram_errors": stub.errors,
+                "delivered": len(lags),
+                "undelivered": len(booked_at) - len(lags),
+                "lag_ms": percentiles(lags),
+            },
+        }
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    print(output)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return result
+
+
+if __name__ == "__main__":
+    main()
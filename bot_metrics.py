@@ -0,0 +1,92 @@
+# bot_metrics.py
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramUnauthorizedError,
+)
+from aiohttp import web
+
+from metrics import CONTENT_TYPE, REGISTRY, TELEGRAM_SEND
+
+# Long polling висит до таймаута — в гистограмму отправок его не пишем
+SKIP_METHODS = {"getUpdates"}
+
+BOT_UPDATES = REGISTRY.histogram(
+    "vrzone_bot_update_seconds",
+    "Обработка обновления Telegram хэндлерами aiogram",
+    labels=("bot", "outcome"),
+)
+
+
+def _outcome(error: Exception) -> str:
+    if isinstance(error, TelegramRetryAfter):
+        return "retry_after"
+    if isinstance(error, (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramUnauthorizedError)):
+        return "rejected"
+    return "error"
+
+
+class TelegramCallMetrics(BaseRequestMiddleware):
+    """Время и исход каждого вызова Bot API: bot.session.middleware(TelegramCallMetrics("client"))"""
+
+    def __init__(self, source: str):
+        self.source = source
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        if name in SKIP_METHODS:
+            return await make_request(bot, method)
+
+        started = time.perf_counter()
+        try:
+            response = await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_SEND.observe(time.perf_counter() - started, self.source, name, _outcome(e))
+            raise
+        TELEGRAM_SEND.observe(time.perf_counter() - started, self.source, name, "ok")
+        return response
+
+
+class UpdateMetrics(BaseMiddleware):
+    """Время обработки обновления: dp.update.outer_middleware(UpdateMetrics({bot.id: "client"}))"""
+
+    def __init__(self, names: Dict[int, str]):
+        self.names = names
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        bot = data.get("bot")
+        label = self.names.get(bot.id, str(bot.id)) if bot is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except Exception:
+            BOT_UPDATES.observe(time.perf_counter() - started, label, "error")
+            raise
+        BOT_UPDATES.observe(time.perf_counter() - started, label, "ok")
+        return result
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def serve_metrics(host: str, port: int) -> web.AppRunner:
+    """Отдельный /metrics для режима polling (в webhook-режиме он на сервере вебхуков)"""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,78 @@
+# contacts.py
+import os
+from typing import Optional
+
+from sqlalchemy import event, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from models import Client
+from phones import normalize_phone
+
+
+class ContactStore:
+    """Связка телефон -> Telegram user_id в таблице client (для бота).
+
+    Работает через async-движок (aiosqlite), чтобы event loop aiogram не
+    блокировался на диске. Чтения номера здесь нет: веб-приложение
+    получает чат клиента из Client.upsert (RETURNING) в транзакции
+    брони, без отдельного запроса и без кэша.
+    """
+
+    def __init__(self, database_path: str, busy_timeout: int = 5000):
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{database_path}",
+            connect_args={"timeout": busy_timeout / 1000},
+        )
+
+        @event.listens_for(self.engine.sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+    @classmethod
+    def from_env(cls) -> "ContactStore":
+        default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "bookings.db")
+        return cls(os.getenv("DATABASE_PATH", default))
+
+    # -------------------------------------------------
+
+    async def link(self, phone: str, user_id: int, name: str) -> Optional[int]:
+        """Привязывает номер к Telegram-пользователю, возвращает id клиента.
+
+        Если клиента с таким номером ещё нет, он создаётся (без даты
+        первой брони). Прежние номера этого пользователя отвязываются.
+        """
+        phone_e164 = normalize_phone(phone)
+        if phone_e164 is None:
+            return None
+
+        table = Client.__table__
+        insert = sqlite_insert(table).values(
+            name=name or "Клиент",
+            phone=phone,
+            phone_e164=phone_e164,
+            telegram_user_id=user_id,
+            first_booking_date=None,
+        )
+        insert = insert.on_conflict_do_update(
+            index_elements=[table.c.phone_e164],
+            set_={"telegram_user_id": insert.excluded.telegram_user_id},
+        ).returning(table.c.id)
+
+        unlink = (
+            update(table)
+            .where(table.c.telegram_user_id == user_id, table.c.phone_e164 != phone_e164)
+            .values(telegram_user_id=None)
+        )
+
+        async with self.engine.begin() as conn:
+            client_id = (await conn.execute(insert)).scalar_one()
+            await conn.execute(unlink)
+        return client_id
+
+    async def close(self) -> None:
+        await self.engine.dispose()
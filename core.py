@@ -1,12 +1,25 @@
 # core.py
 import os
 import logging
-import re
-import requests
-from typing import Tuple
-
-from flask import Flask, flash, redirect, url_for, request
-from models import db
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from flask import Flask, flash, jsonify, redirect, url_for, request
+from sqlalchemy import event, inspect, text
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from admin import AdminReports
+from archive import BookingArchive
+from admission import ADMISSION_REJECTED, AdmissionLimiter, IdempotencyCache, parse_limit
+from assets import AssetManifest
+from availability import AvailabilityEngine
+from instrumentation import AppMetrics
+from models import db, Booking, BookingRollup, Client
+from notifier import TelegramNotifier
+from page_cache import PageCache
+from phones import normalize_phone
+from reminders import ReminderScheduler, parse_offsets
 
 
 class VRZoneBaseApp:
@@ -29,19 +42,83 @@ class VRZoneBaseApp:
         # 🔹 Flask config
         self.app.config["SECRET_KEY"] = self.secret_key
         self.app.config["SQLALCHEMY_DATABASE_URI"] = (
-            "sqlite:///" + os.path.join(self.app.instance_path, "bookings.db")
+            "sqlite:///" + self.database_path
         )
         self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "pool_size": self.db_pool_size,
+            "max_overflow": self.db_pool_size,
+            "pool_timeout": 30,
+            "connect_args": {
+                "timeout": self.sqlite_busy_timeout / 1000,
+                "check_same_thread": False,
+            },
+        }
+
+        # 🔹 Настоящий IP клиента за обратным прокси
+        if self.proxy_hops:
+            self.app.wsgi_app = ProxyFix(self.app.wsgi_app, x_for=self.proxy_hops)
 
         # 🔹 SQLAlchemy
         db.init_app(self.app)
 
+        # 🔹 Слоты и занятость станций
+        self.availability = AvailabilityEngine(stations=self.stations)
+
         # 🔹 Создание БД
         self._init_db()
 
+        # 🔹 Метрики (/metrics) и лог медленных запросов
+        self.metrics = AppMetrics(
+            self.app,
+            self.logger,
+            slow_request_ms=self.slow_request_ms,
+            token=self.metrics_token,
+            directory=self.metrics_dir,
+        )
+
+        # 🔹 Статика с хэшами в именах (manifest от `python assets.py`)
+        self.assets = AssetManifest(self.app)
+
+        # 🔹 Кэш статичных страниц
+        self.page_cache = PageCache(self.app, self.logger, enabled=self.page_cache_enabled)
+
+        # 🔹 Уведомления (outbox + фоновый диспетчер)
+        self.notifier = TelegramNotifier(
+            self.app,
+            self.bot_token,
+            self.logger,
+            api_url=self.telegram_api_url,
+            retention_days=self.outbox_retention_days,
+        )
+
+        # 🔹 Напоминания перед сеансом (через тот же outbox)
+        self.reminders = ReminderScheduler(
+            self.app,
+            self.notifier,
+            self.logger,
+            offsets=self.reminder_offsets,
+            clock=self.venue_now,
+        )
+
+        # 🔹 Защита /book: повторы формы и поток заявок отсекаются до записи брони
+        self.idempotency = IdempotencyCache()
+        self.ip_limiter = AdmissionLimiter("ip", *self.book_ip_limit) if self.book_ip_limit else None
+        self.phone_limiter = AdmissionLimiter("phone", *self.book_phone_limit) if self.book_phone_limit else None
+
+        # 🔹 Архив старых броней (помесячные сегменты, история клиента читает их прозрачно)
+        self.archive = BookingArchive(self.archive_dir)
+
+        # 🔹 Отчёты для админки (/admin/api/...)
+        self.admin = AdminReports(self.app, self.admin_token, archive=self.archive)
+
         # 🔹 Ошибки
         self._register_error_handlers()
 
+        # 🔹 После fork (gunicorn --preload) соединения родителя не используем
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
         self.logger.info("VRZone приложение успешно инициализировано")
 
     # -------------------------------------------------
@@ -50,6 +127,39 @@ class VRZoneBaseApp:
         self.bot_token = os.getenv("BOT_TOKEN")
         self.chat_id = os.getenv("CHAT_ID")
         self.secret_key = os.getenv("SECRET_KEY", "dev-secret-key")
+        self.stations = int(os.getenv("STATIONS", "2"))
+        self.page_cache_enabled = os.getenv("PAGE_CACHE", "1") != "0"
+        self.db_pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+        self.sqlite_busy_timeout = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+        self.admin_token = os.getenv("ADMIN_TOKEN")
+        self.database_path = os.getenv(
+            "DATABASE_PATH", os.path.join(self.app.instance_path, "bookings.db")
+        )
+        self.telegram_api_url = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+        self.slow_request_ms = int(os.getenv("SLOW_REQUEST_MS", "0"))
+        self.metrics_token = os.getenv("METRICS_TOKEN")
+        self.metrics_dir = os.getenv("METRICS_DIR")
+        # Сколько дней хранить отправленные уведомления в outbox, "0" — не удалять
+        self.outbox_retention_days = float(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+        # Лимиты заявок: N/секунды, "0" отключает
+        self.book_ip_limit = parse_limit(os.getenv("BOOK_IP_LIMIT"), "5/60")
+        self.book_phone_limit = parse_limit(os.getenv("BOOK_PHONE_LIMIT"), "3/600")
+        # Сколько обратных прокси добавляют X-Forwarded-For перед приложением
+        self.proxy_hops = int(os.getenv("PROXY_HOPS", "0"))
+        # Напоминания клиентам: за сколько минут до сеанса, "0" отключает
+        self.reminder_offsets = parse_offsets(os.getenv("REMINDER_OFFSETS"))
+        # Часовой пояс площадки: start_at хранится как местное время из формы,
+        # а контейнер обычно работает в UTC
+        venue_tz = os.getenv("VENUE_TZ") or "Asia/Almaty"
+        try:
+            self.venue_tz = ZoneInfo(venue_tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise RuntimeError(f"VENUE_TZ: неизвестный часовой пояс '{venue_tz}'")
+        # Архив старых броней (python archive.py): каталог сегментов и горизонт в днях
+        self.archive_dir = os.getenv("ARCHIVE_DIR") or os.path.join(
+            os.path.dirname(self.database_path), "archive"
+        )
+        self.archive_after_days = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
 
         if not self.bot_token:
             raise RuntimeError("BOT_TOKEN не задан в окружении контейнера")
@@ -67,12 +177,140 @@ class VRZoneBaseApp:
     # -------------------------------------------------
 
     def _init_db(self):
-        os.makedirs(self.app.instance_path, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.database_path)), exist_ok=True)
 
         with self.app.app_context():
+            self._configure_sqlite(db.engine)
             db.create_all()
+            self._migrate_db()
             self.logger.info("База данных инициализирована")
 
+    def _configure_sqlite(self, engine):
+        """WAL, busy_timeout и собственное управление транзакциями для pysqlite"""
+        busy_timeout = self.sqlite_busy_timeout
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            # Отключаем неявный BEGIN драйвера — транзакции открываем сами в "begin"
+            dbapi_connection.isolation_level = None
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.close()
+
+        @event.listens_for(engine, "begin")
+        def on_begin(conn):
+            if conn.get_execution_options().get("sqlite_immediate"):
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+            else:
+                conn.exec_driver_sql("BEGIN")
+
+    def _after_fork(self):
+        with self.app.app_context():
+            db.engine.dispose(close=False)
+
+    # Колонки, добавленные после первой версии схемы: (таблица, колонка, DDL)
+    SCHEMA_PATCHES = [
+        ("booking", "station", "INTEGER NOT NULL DEFAULT 1"),
+        ("booking", "start_at", "DATETIME"),
+        ("booking", "end_at", "DATETIME"),
+        ("client", "phone_e164", "VARCHAR(20)"),
+        ("client", "telegram_user_id", "BIGINT"),
+        ("notification_outbox", "priority", "INTEGER NOT NULL DEFAULT 0"),
+        ("booking", "idempotency_key", "VARCHAR(64)"),
+        ("client", "bookings_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("client", "last_booking_date", "DATETIME"),
+    ]
+
+    # Создаются после заполнения данных (уникальный индекс — после слияния дублей)
+    SCHEMA_INDEXES = [
+        "CREATE INDEX IF NOT EXISTS ix_booking_station_start ON booking (station, start_at)",
+        "CREATE INDEX IF NOT EXISTS ix_booking_start_at ON booking (start_at)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_client_phone_e164 ON client (phone_e164)",
+        "CREATE INDEX IF NOT EXISTS ix_client_telegram_user_id ON client (telegram_user_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_booking_idempotency_key ON booking (idempotency_key)",
+    ]
+
+    def _migrate_db(self):
+        """Доводит существующую БД до текущей схемы (create_all не меняет таблицы)"""
+        inspector = inspect(db.engine)
+        existing = {
+            table: {c["name"] for c in inspector.get_columns(table)}
+            for table in {patch[0] for patch in self.SCHEMA_PATCHES}
+        }
+
+        added = set()
+        with db.engine.begin() as conn:
+            for table, column, ddl in self.SCHEMA_PATCHES:
+                if column not in existing[table]:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                    added.add((table, column))
+                    self.logger.info(f"Миграция: добавлена колонка {table}.{column}")
+
+        filled = self.availability.backfill()
+        if filled:
+            self.logger.info(f"Миграция: заполнены слоты для {filled} броней")
+
+        if BookingRollup.query.first() is None and Booking.query.filter(Booking.start_at.isnot(None)).first():
+            groups = BookingRollup.rebuild()
+            self.logger.info(f"Миграция: построено {groups} строк агрегатов")
+
+        merged = self._backfill_client_phones()
+        if merged:
+            self.logger.info(f"Миграция: объединено {merged} дублей клиентов по телефону")
+
+        # Только при появлении колонок: позже часть броней уже может быть в архиве
+        if ("client", "bookings_count") in added:
+            updated = Client.rebuild_counters()
+            self.logger.info(f"Миграция: посчитаны брони для {updated} клиентов")
+
+        with db.engine.begin() as conn:
+            for statement in self.SCHEMA_INDEXES:
+                conn.execute(text(statement))
+
+    def _backfill_client_phones(self) -> int:
+        """Заполняет client.phone_e164 и сливает клиентов с одним номером.
+
+        Бронирования дублей переносятся на клиента с наименьшим id.
+        Возвращает число удалённых дублей.
+        """
+        pending = Client.query.filter(Client.phone_e164.is_(None)).all()
+        if not pending:
+            return 0
+        for client in pending:
+            # Нераспознанный номер оставляем как есть, чтобы ключ был уникальным
+            client.phone_e164 = self.normalize_phone(client.phone) or client.phone
+        db.session.flush()
+
+        duplicates = (
+            db.session.query(Client.phone_e164)
+            .group_by(Client.phone_e164)
+            .having(db.func.count(Client.id) > 1)
+            .all()
+        )
+        merged = 0
+        for (key,) in duplicates:
+            keeper, *others = Client.query.filter_by(phone_e164=key).order_by(Client.id).all()
+            for other in others:
+                Booking.query.filter_by(client_id=other.id).update({"client_id": keeper.id})
+                if other.first_booking_date and (
+                    keeper.first_booking_date is None
+                    or other.first_booking_date < keeper.first_booking_date
+                ):
+                    keeper.first_booking_date = other.first_booking_date
+                keeper.bookings_count = (keeper.bookings_count or 0) + (other.bookings_count or 0)
+                if other.last_booking_date and (
+                    keeper.last_booking_date is None
+                    or other.last_booking_date > keeper.last_booking_date
+                ):
+                    keeper.last_booking_date = other.last_booking_date
+                db.session.delete(other)
+                merged += 1
+        db.session.commit()
+        return merged
+
     # -------------------------------------------------
 
     def _register_error_handlers(self):
@@ -85,16 +323,41 @@ class VRZoneBaseApp:
         def internal_error(error):
             self.logger.exception("500 ошибка")
             db.session.rollback()
+            # JSON-клиентам (fetch, админка) — JSON, а не редирект на страницу
+            if request.path.startswith(("/api/", "/admin/api/")):
+                return jsonify({"ok": False, "message": "Внутренняя ошибка сервера"}), 500
             flash("Внутренняя ошибка сервера", "error")
             return redirect(url_for("index"))
 
     # -------------------------------------------------
     # Валидация
 
+    # Общая с ботом реализация (phones.py)
+    normalize_phone = staticmethod(normalize_phone)
+
     @staticmethod
     def validate_phone(phone: str) -> bool:
-        digits = re.sub(r"\D", "", phone)
-        return len(digits) >= 10
+        return VRZoneBaseApp.normalize_phone(phone) is not None
+
+    @staticmethod
+    def booking_field_errors(name: str, phone: str, date: str, time_: str) -> Dict[str, str]:
+        """Ошибки по полям формы: {"phone": "Неверный номер телефона", ...}"""
+        errors = {}
+        if not name.strip():
+            errors["name"] = "Укажите имя"
+        elif len(name.strip()) < 2:
+            errors["name"] = "Имя слишком короткое"
+
+        if not phone.strip():
+            errors["phone"] = "Укажите телефон"
+        elif not VRZoneBaseApp.validate_phone(phone):
+            errors["phone"] = "Неверный номер телефона"
+
+        if not date.strip():
+            errors["date"] = "Укажите дату"
+        if not time_.strip():
+            errors["time"] = "Укажите время"
+        return errors
 
     @staticmethod
     def validate_booking_data(
@@ -104,36 +367,62 @@ class VRZoneBaseApp:
         if not all([name.strip(), phone.strip(), date.strip(), time_.strip()]):
             return False, "Заполните все поля"
 
-        if len(name.strip()) < 2:
-            return False, "Имя слишком короткое"
-
-        if not VRZoneBaseApp.validate_phone(phone):
-            return False, "Неверный номер телефона"
+        errors = VRZoneBaseApp.booking_field_errors(name, phone, date, time_)
+        if errors:
+            return False, next(iter(errors.values()))
 
         return True, ""
 
+    # -------------------------------------------------
+    # Приём заявок
+
+    def admit_booking(self, remote_addr: Optional[str], phone_e164: Optional[str]) -> float:
+        """Лимит заявок до записи брони: сначала по IP, затем по номеру.
+
+        Возвращает 0, если заявку можно обрабатывать, иначе — через
+        сколько секунд повторить.
+        """
+        for scope, limiter, key in (
+            ("ip", self.ip_limiter, remote_addr),
+            ("phone", self.phone_limiter, phone_e164),
+        ):
+            if limiter is None or key is None:
+                continue
+            wait = limiter.admit(key)
+            if wait:
+                ADMISSION_REJECTED.inc(scope)
+                self.logger.warning(f"Заявка отклонена лимитом ({scope})")
+                return wait
+        return 0.0
+
+    # -------------------------------------------------
+    # Время
+
+    def venue_now(self) -> datetime:
+        """Текущее местное время площадки без tzinfo — в той же шкале, что booking.start_at"""
+        return datetime.now(self.venue_tz).replace(tzinfo=None)
+
     # -------------------------------------------------
     # Telegram
 
-    def send_telegram_message(self, text: str) -> None:
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-        payload = {
-            "chat_id": self.chat_id,
-            "text": text,
-            "parse_mode": "HTML",
-        }
+    def queue_telegram_message(self, text: str) -> None:
+        """Кладёт сообщение админу в outbox в рамках текущей транзакции.
 
-        try:
-            r = requests.post(url, data=payload, timeout=10)
-            if r.ok:
-                self.logger.info("Сообщение отправлено в Telegram")
-            else:
-                self.logger.error(f"Telegram ошибка: {r.status_code} {r.text}")
-        except Exception:
-            self.logger.exception("Ошибка отправки Telegram")
+        После коммита нужно вызвать ``self.notifier.wake()``.
+        """
+        self.notifier.enqueue(self.chat_id, text)
+
+    def send_telegram_message(self, text: str) -> None:
+        """Ставит сообщение в очередь отдельной транзакцией и будит диспетчер"""
+        with self.app.app_context():
+            self.queue_telegram_message(text)
+            db.session.commit()
+        self.notifier.wake()
 
     # -------------------------------------------------
 
     def run(self, port: int = 5000, debug: bool = False):
         self.logger.info(f"Flask запущен на порту {port}")
+        self.notifier.start()
+        self.reminders.start()
         self.app.run(host="0.0.0.0", port=port, debug=debug)
@@ -0,0 +1,56 @@
+# gunicorn.conf.py
+# Запуск: gunicorn -c gunicorn.conf.py "app:create_app()"
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Процессы для CPU (рендер, JSON), потоки — чтобы ожидание SQLite не блокировало воркер
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+
+# Приложение (create_all, миграции, конфиг) инициализируется один раз в мастере
+preload_app = True
+
+timeout = 30
+graceful_timeout = 20
+keepalive = 5
+max_requests = 2000
+max_requests_jitter = 200
+
+# Воркеры складывают снимки метрик сюда, /metrics любого воркера отдаёт сумму
+_own_metrics_dir = "METRICS_DIR" not in os.environ
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="vrzone-metrics-"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Потоки мастера не переживают fork — диспетчер и напоминания нужны в каждом воркере
+    from app import get_application
+
+    application = get_application()
+    application.notifier.start()
+    application.reminders.start()
+
+
+def worker_exit(server, worker):
+    from metrics import REGISTRY
+
+    REGISTRY.dump()
+
+
+def child_exit(server, worker):
+    # Счётчики завершившегося воркера уходят в архив, чтобы сумма не «проседала»
+    from metrics import REGISTRY
+
+    REGISTRY.retire(worker.pid)
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
@@ -0,0 +1,178 @@
+# instrumentation.py
+import threading
+import time
+from typing import Optional
+
+from flask import Response, request
+from sqlalchemy import event
+
+from admin import bearer_token_valid
+from metrics import COUNT_BUCKETS, CONTENT_TYPE, REGISTRY
+from models import db, NotificationOutbox
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "vrzone_http_requests",
+    "HTTP-запросы по эндпоинту и коду ответа",
+    labels=("method", "endpoint", "status"),
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "vrzone_http_request_seconds",
+    "Время обработки HTTP-запроса",
+    labels=("endpoint",),
+)
+REQUEST_QUERIES = REGISTRY.histogram(
+    "vrzone_db_queries_per_request",
+    "Число SQL-запросов на HTTP-запрос",
+    labels=("endpoint",),
+    buckets=COUNT_BUCKETS,
+)
+REQUEST_SQL_TIME = REGISTRY.histogram(
+    "vrzone_db_request_seconds",
+    "Суммарное время SQL на HTTP-запрос",
+    labels=("endpoint",),
+)
+QUERY_DURATION = REGISTRY.histogram(
+    "vrzone_db_query_seconds",
+    "Время одного SQL-запроса (включая фоновый диспетчер)",
+)
+SLOW_REQUESTS = REGISTRY.counter(
+    "vrzone_slow_requests",
+    "Запросы дольше порога SLOW_REQUEST_MS",
+    labels=("endpoint",),
+)
+
+
+class _RequestStats:
+    """Счётчики текущего запроса; statements собираются только для лога медленных"""
+
+    __slots__ = ("started", "queries", "sql_time", "statements")
+
+    def __init__(self, started: float, collect: bool):
+        self.started = started
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = [] if collect else None
+
+
+class AppMetrics:
+    """Замеры горячего пути и эндпоинт /metrics в формате Prometheus.
+
+    Время запроса и число/время SQL-запросов на него считаются хуками
+    Flask и SQLAlchemy (before/after_cursor_execute). При
+    SLOW_REQUEST_MS > 0 запросы дольше порога пишутся в лог с разбивкой
+    по SQL. METRICS_TOKEN, если задан, закрывает /metrics Bearer-токеном.
+    """
+
+    def __init__(
+        self,
+        app,
+        logger,
+        slow_request_ms: int = 0,
+        token: Optional[str] = None,
+        directory: Optional[str] = None,
+    ):
+        self.logger = logger
+        self.slow_request = slow_request_ms / 1000
+        self.token = token
+        self._local = threading.local()
+
+        REGISTRY.use_directory(directory)
+        REGISTRY.gauge(
+            "vrzone_outbox_pending",
+            "Уведомления в outbox, ожидающие отправки",
+            lambda: self._outbox_count("pending"),
+        )
+        REGISTRY.gauge(
+            "vrzone_outbox_dead",
+            "Уведомления, отброшенные после всех попыток",
+            lambda: self._outbox_count("dead"),
+        )
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics)
+
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(db.engine, "after_cursor_execute", self._after_cursor_execute)
+
+    # -------------------------------------------------
+    # Flask
+
+    def _before_request(self):
+        self._local.stats = _RequestStats(time.perf_counter(), self.slow_request > 0)
+
+    def _after_request(self, response):
+        stats = getattr(self._local, "stats", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or "unmatched"
+
+        HTTP_REQUESTS.inc(request.method, endpoint, str(response.status_code))
+        HTTP_DURATION.observe(elapsed, endpoint)
+        REQUEST_QUERIES.observe(stats.queries, endpoint)
+        REQUEST_SQL_TIME.observe(stats.sql_time, endpoint)
+
+        if self.slow_request and elapsed >= self.slow_request:
+            SLOW_REQUESTS.inc(endpoint)
+            self._log_slow(elapsed, stats, response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        self._local.stats = None
+        REGISTRY.maybe_dump()
+
+    def _log_slow(self, elapsed: float, stats: _RequestStats, status: int) -> None:
+        grouped = {}
+        for statement, duration in stats.statements:
+            entry = grouped.setdefault(statement, [0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+        top = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:5]
+
+        lines = [
+            f"Медленный запрос {request.method} {request.path} -> {status}: "
+            f"{elapsed * 1000:.0f} мс, SQL: {stats.queries} запр. / {stats.sql_time * 1000:.0f} мс"
+        ]
+        for statement, (count, duration) in top:
+            lines.append(f"  {duration * 1000:.1f} мс x{count}: {' '.join(statement.split())[:300]}")
+        self.logger.warning("\n".join(lines))
+
+    # -------------------------------------------------
+    # SQLAlchemy
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._vrz_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_vrz_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        QUERY_DURATION.observe(elapsed)
+
+        stats = getattr(self._local, "stats", None)
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_time += elapsed
+            if stats.statements is not None:
+                stats.statements.append((statement, elapsed))
+
+    # -------------------------------------------------
+
+    @staticmethod
+    def _outbox_count(status: str) -> int:
+        return db.session.scalar(
+            db.select(db.func.count())
+            .select_from(NotificationOutbox)
+            .where(NotificationOutbox.status == status)
+        )
+
+    def metrics(self):
+        if self.token and not bearer_token_valid(self.token):
+            return Response("unauthorized\n", status=401, mimetype="text/plain")
+        REGISTRY.dump()
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
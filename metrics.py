@@ -0,0 +1,274 @@
+# metrics.py
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Значения хранятся в обычных списках и увеличиваются без блокировок:
+под GIL редкая потеря инкремента при гонке допустима для метрик и
+дешевле мьютекса на горячем пути. В многопроцессном gunicorn каждый
+воркер периодически сбрасывает снимок в METRICS_DIR, а /metrics
+складывает снимки всех воркеров.
+"""
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Секунды: от быстрых SQL-запросов до медленной отправки в Telegram
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# Сумма снимков завершившихся воркеров
+RETIRED = "retired.json"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._cells: Dict[Tuple[str, ...], List[float]] = {}
+
+    def _cell(self, labels: Tuple[str, ...]) -> List[float]:
+        cell = self._cells.get(labels)
+        if cell is None:
+            cell = self._cells.setdefault(labels, self._new_cell())
+        return cell
+
+    def _new_cell(self) -> List[float]:
+        return [0.0]
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._cell(labels)[0] += amount
+
+    def samples(self, cells) -> Iterable[str]:
+        for labels, cell in sorted(cells.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(cell[0])}"
+
+
+class Histogram(Counter):
+    """Гистограмма с фиксированными корзинами.
+
+    Ячейка — один список: счётчики корзин (последняя — +Inf), сумма и
+    количество наблюдений.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def _new_cell(self) -> List[float]:
+        return [0.0] * (len(self.buckets) + 3)
+
+    def observe(self, value: float, *labels: str) -> None:
+        cell = self._cell(labels)
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def samples(self, cells) -> Iterable[str]:
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        for labels, cell in sorted(cells.items()):
+            cumulative = 0.0
+            for bound, count in zip(bounds, cell):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {_format_value(cell[-2])}"
+            yield f"{self.name}_count{label_str} {_format_value(cell[-1])}"
+
+
+class Gauge:
+    """Значение, вычисляемое в момент запроса /metrics (в процессе, который его обслуживает)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Gauge] = {}
+        self.directory: Optional[str] = None
+        self.dump_interval = 5.0
+        self._dumped_at = 0.0
+        # Дочерний процесс начинает с нуля: иначе значения мастера посчитаются в каждом воркере
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self) -> None:
+        for metric in self._metrics.values():
+            metric._cells.clear()
+        self._dumped_at = 0.0
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float]) -> Gauge:
+        self._gauges[name] = Gauge(name, documentation, read)
+        return self._gauges[name]
+
+    def _register(self, metric):
+        # Повторная регистрация (перезагрузка модуля, второе приложение) отдаёт существующую метрику
+        return self._metrics.setdefault(metric.name, metric)
+
+    # -------------------------------------------------
+    # Несколько процессов
+
+    def use_directory(self, directory: Optional[str]) -> None:
+        """Включает обмен снимками через каталог (общий для воркеров gunicorn)"""
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def snapshot(self) -> dict:
+        return {
+            name: [[list(labels), list(cell)] for labels, cell in list(metric._cells.items())]
+            for name, metric in self._metrics.items()
+        }
+
+    def dump(self) -> None:
+        if not self.directory:
+            return
+        self._dumped_at = time.monotonic()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def maybe_dump(self) -> None:
+        """Сбрасывает снимок не чаще раза в dump_interval секунд"""
+        if self.directory and time.monotonic() - self._dumped_at >= self.dump_interval:
+            self.dump()
+
+    def retire(self, pid: int) -> None:
+        """Переносит снимок завершившегося воркера в общий архив.
+
+        Вызывается мастером gunicorn: счётчики остаются монотонными и
+        после перезапуска воркеров (max_requests).
+        """
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"{pid}.json")
+        archive = os.path.join(self.directory, RETIRED)
+        data = self._load(path)
+        if data is None:
+            return
+        merged = self._load(archive) or {}
+        self._merge(merged, data, create=True)
+        tmp = f"{archive}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(merged, f)
+        os.replace(tmp, archive)
+        os.remove(path)
+
+    @staticmethod
+    def _load(path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _merge(target: dict, data: dict, create: bool = False) -> None:
+        """Складывает снимок `data` в `target` ({метрика: [[метки, ячейка], ...]})"""
+        for name, cells in data.items():
+            current = target.get(name)
+            if current is None:
+                if not create:
+                    continue
+                current = target[name] = []
+            index = {tuple(labels): i for i, (labels, _) in enumerate(current)}
+            for labels, cell in cells:
+                i = index.get(tuple(labels))
+                if i is None or len(current[i][1]) != len(cell):
+                    current.append([labels, list(cell)])
+                else:
+                    current[i][1] = [a + b for a, b in zip(current[i][1], cell)]
+
+    def _collect(self) -> Dict[str, Dict[Tuple[str, ...], List[float]]]:
+        merged = self.snapshot()
+        if self.directory:
+            own = f"{os.getpid()}.json"
+            for filename in os.listdir(self.directory):
+                if filename.endswith(".json") and filename != own:
+                    data = self._load(os.path.join(self.directory, filename))
+                    if data:
+                        self._merge(merged, data)
+        return {
+            name: {tuple(labels): cell for labels, cell in cells}
+            for name, cells in merged.items()
+        }
+
+    # -------------------------------------------------
+
+    def render(self) -> str:
+        lines = []
+        for name, cells in self._collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.samples(cells))
+        for gauge in self._gauges.values():
+            try:
+                value = gauge.read()
+            except Exception:
+                continue
+            lines.append(f"# HELP {gauge.name} {gauge.documentation}")
+            lines.append(f"# TYPE {gauge.name} gauge")
+            lines.append(f"{gauge.name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Общие для веб-приложения и ботов: отправка в Telegram
+TELEGRAM_SEND = REGISTRY.histogram(
+    "vrzone_telegram_send_seconds",
+    "Длительность вызовов Telegram Bot API",
+    labels=("source", "method", "outcome"),
+)
@@ -1,23 +1,97 @@
 # models.py
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime
+from typing import Optional, Tuple
 
 db = SQLAlchemy()
 
+
+def begin_immediate():
+    """Открывает транзакцию записи сразу с блокировкой (BEGIN IMMEDIATE).
+
+    Вызывать первым обращением к БД в транзакции, которая сначала читает,
+    а потом пишет: иначе в WAL-режиме повышение блокировки может сразу
+    упасть с "database is locked", минуя busy_timeout.
+    """
+    db.session.connection(execution_options={"sqlite_immediate": True})
+
 class Client(db.Model):
     __tablename__ = "client"
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(50), nullable=False, unique=True)
+    # Канонический номер (E.164) — ключ клиента; phone хранит первый введённый вариант
+    phone_e164 = db.Column(db.String(20), nullable=False)
+    # Telegram-пользователь, поделившийся этим номером с клиентским ботом
+    telegram_user_id = db.Column(db.BigInteger, nullable=True)
     email = db.Column(db.String(100), nullable=True)
     first_booking_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Счётчики по всей истории, включая брони, перенесённые в архив (archive.py)
+    bookings_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_booking_date = db.Column(db.DateTime, nullable=True)
     
     bookings = db.relationship("Booking", backref="client", lazy=True)
+
+    __table_args__ = (
+        db.Index("ux_client_phone_e164", "phone_e164", unique=True),
+        db.Index("ix_client_telegram_user_id", "telegram_user_id"),
+    )
     
     def __repr__(self):
         return f"<Client {self.name}>"
 
+    @classmethod
+    def upsert(cls, name: str, phone: str, phone_e164: str) -> Tuple[int, Optional[int]]:
+        """Создаёт клиента или обновляет имя одним запросом.
+
+        INSERT ... ON CONFLICT(phone_e164) DO UPDATE ... RETURNING не
+        гоняется с параллельной вставкой того же номера, в отличие от
+        SELECT + INSERT. Возвращает (id, telegram_user_id) — чат клиента
+        известен без отдельного запроса. Вызывается в транзакции брони:
+        счётчик броней растёт вместе с ней и откатывается при отказе.
+        """
+        now = datetime.utcnow()
+        stmt = sqlite_insert(cls).values(
+            name=name,
+            phone=phone,
+            phone_e164=phone_e164,
+            first_booking_date=now,
+            bookings_count=1,
+            last_booking_date=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.phone_e164],
+            set_={
+                "name": stmt.excluded.name,
+                # Клиент мог появиться через бота раньше первой брони
+                "first_booking_date": db.func.coalesce(
+                    cls.first_booking_date, stmt.excluded.first_booking_date
+                ),
+                "bookings_count": cls.bookings_count + 1,
+                "last_booking_date": stmt.excluded.last_booking_date,
+            },
+        ).returning(cls.id, cls.telegram_user_id)
+        return tuple(db.session.execute(stmt).one())
+
+    @classmethod
+    def rebuild_counters(cls) -> int:
+        """Пересчитывает счётчики по таблице booking (миграция, пока архива ещё нет)"""
+        booking = Booking.__table__
+        result = db.session.execute(
+            db.update(cls).values(
+                bookings_count=db.select(db.func.count(booking.c.id))
+                .where(booking.c.client_id == cls.id)
+                .scalar_subquery(),
+                last_booking_date=db.select(db.func.max(booking.c.created_at))
+                .where(booking.c.client_id == cls.id)
+                .scalar_subquery(),
+            )
+        )
+        db.session.commit()
+        return result.rowcount
+
 class Booking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey("client.id"), nullable=True)
@@ -26,4 +100,160 @@ class Booking(db.Model):
     date = db.Column(db.String(20), nullable=False)
     time = db.Column(db.String(20), nullable=False)
     duration = db.Column(db.String(50), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Типизированный слот: станция (шлем) и интервал [start_at, end_at).
+    # NULL только у старых записей, строки которых не удалось разобрать.
+    station = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    start_at = db.Column(db.DateTime, nullable=True)
+    end_at = db.Column(db.DateTime, nullable=True)
+    # Ключ из формы: повторная отправка той же формы не создаёт вторую бронь
+    idempotency_key = db.Column(db.String(64), nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_booking_station_start", "station", "start_at"),
+        db.Index("ix_booking_start_at", "start_at"),
+        db.Index("ux_booking_idempotency_key", "idempotency_key", unique=True),
+    )
+
+class NotificationOutbox(db.Model):
+    """Очередь исходящих уведомлений (пишется в той же транзакции, что и бронь)"""
+    __tablename__ = "notification_outbox"
+
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.BigInteger, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    # pending -> sent | dead
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    # Меньше — важнее (см. scheduler.PRIORITY_*)
+    priority = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_outbox_status_next", "status", "next_attempt_at"),
+    )
+
+    def __repr__(self):
+        return f"<NotificationOutbox {self.id} {self.status}>"
+
+
+class ChatThrottle(db.Model):
+    """Общий для всех воркеров лимит отправки в чат (GCRA).
+
+    allowed_at — «теоретическое время прихода» следующего сообщения:
+    отправка разрешена, пока allowed_at - запас <= сейчас, и каждая
+    сдвигает его на 1/rate. Одна строка на чат, обновляется в той же
+    транзакции, что и аренда сообщения в outbox.
+    """
+    __tablename__ = "chat_throttle"
+
+    chat_id = db.Column(db.BigInteger, primary_key=True)
+    allowed_at = db.Column(db.DateTime, nullable=False)
+
+
+class AdmissionThrottle(db.Model):
+    """Общий для всех воркеров лимит приёма заявок (GCRA), как ChatThrottle.
+
+    key — область и значение ("ip:1.2.3.4", "phone:+77011234567").
+    Строка с allowed_at в прошлом ничем не отличается от отсутствующей,
+    поэтому такие периодически удаляются.
+    """
+    __tablename__ = "admission_throttle"
+
+    key = db.Column(db.String(80), primary_key=True)
+    allowed_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# Колонки брони в архиве и в выгрузке /admin/api/bookings/export — строки одной формы
+BOOKING_EXPORT_COLUMNS = [
+    "id", "client_id", "name", "phone", "date", "time", "duration",
+    "station", "start_at", "end_at", "created_at",
+]
+
+
+def isoformat(value):
+    """datetime -> ISO-строка для JSON; остальные значения (и None) как есть"""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# Цены тарифов в тенге (ключ — значение из формы бронирования)
+TARIFF_PRICES = {
+    "30 минут": 3000,
+    "60 минут": 5000,
+    "Компания": 8000,
+}
+
+
+class BookingRollup(db.Model):
+    """Предагрегаты для дашбордов: брони и выручка по дню/часу/тарифу.
+
+    Обновляется инкрементально в транзакции каждой брони, поэтому отчёты
+    не сканируют историю.
+    """
+    __tablename__ = "booking_rollup"
+
+    day = db.Column(db.Date, primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)
+    tariff = db.Column(db.String(50), primary_key=True)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def record(cls, start_at: datetime, tariff: str, count: int = 1) -> None:
+        stmt = sqlite_insert(cls).values(
+            day=start_at.date(),
+            hour=start_at.hour,
+            tariff=tariff,
+            bookings=count,
+            revenue=TARIFF_PRICES.get(tariff, 0) * count,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.day, cls.hour, cls.tariff],
+            set_={
+                "bookings": cls.bookings + stmt.excluded.bookings,
+                "revenue": cls.revenue + stmt.excluded.revenue,
+            },
+        )
+        db.session.execute(stmt)
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Пересчитывает таблицу по всей истории (для миграции), возвращает число строк"""
+        db.session.query(cls).delete()
+        day = db.func.date(Booking.start_at)
+        hour = db.func.strftime("%H", Booking.start_at)
+        groups = (
+            db.session.query(day, hour, Booking.duration, db.func.count(Booking.id))
+            .filter(Booking.start_at.isnot(None))
+            .group_by(day, hour, Booking.duration)
+            .all()
+        )
+        for day_, hour_, tariff, count in groups:
+            db.session.add(cls(
+                day=datetime.strptime(day_, "%Y-%m-%d").date(),
+                hour=int(hour_),
+                tariff=tariff,
+                bookings=count,
+                revenue=TARIFF_PRICES.get(tariff, 0) * count,
+            ))
+        db.session.commit()
+        return len(groups)
+
+
+class BookingReminder(db.Model):
+    """Отметка об отправленном напоминании: одно на бронь и интервал.
+
+    Пишется в той же транзакции, что и сообщение в outbox. Первичный
+    ключ не даёт двум воркерам (или процессу после перезапуска)
+    отправить одно напоминание дважды.
+    """
+    __tablename__ = "booking_reminder"
+
+    booking_id = db.Column(db.Integer, db.ForeignKey("booking.id"), primary_key=True)
+    # За сколько минут до начала сеанса
+    offset_minutes = db.Column(db.Integer, primary_key=True)
+    sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
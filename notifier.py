@@ -0,0 +1,408 @@
+# notifier.py
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from metrics import REGISTRY, TELEGRAM_SEND
+from models import db, ChatThrottle, NotificationOutbox, begin_immediate
+from scheduler import (
+    GROUP_CHAT_LIMITS,
+    PRIORITY_BOOKING,
+    PRIVATE_CHAT_LIMITS,
+    burst_allowance,
+    chat_limits,
+)
+
+
+class TelegramNotifier:
+    """Фоновая доставка уведомлений из outbox в Telegram.
+
+    Запись в outbox делается в транзакции бронирования, а отправка —
+    в отдельном потоке через keep-alive сессию. Сбой Telegram не влияет
+    на /book: сообщение остаётся в таблице и будет доставлено позже.
+    Очередь разбирается по приоритету, частота отправки в каждый чат
+    ограничена лимитами Telegram (scheduler.chat_limits) — общими для
+    всех процессов через таблицу chat_throttle.
+
+    Отправленные сообщения хранятся `retention_days` дней, затем
+    удаляются тем же потоком, чтобы таблица не росла без предела.
+    """
+
+    def __init__(
+        self,
+        app,
+        bot_token: str,
+        logger,
+        api_url: str = "https://api.telegram.org",
+        poll_interval: float = 5.0,
+        batch_size: int = 20,
+        max_attempts: int = 8,
+        base_delay: float = 2.0,
+        max_delay: float = 600.0,
+        lease: float = 60.0,
+        retention_days: float = 7.0,
+        purge_interval: float = 3600.0,
+    ):
+        self.app = app
+        self.bot_token = bot_token
+        self.logger = logger
+        self.api_url = api_url.rstrip("/")
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        # 0 — отправленные сообщения не удаляются
+        self.retention = timedelta(days=retention_days) if retention_days > 0 else None
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._http: Optional[requests.Session] = None
+        # Глобальная пауза после 429 (monotonic), чтобы не долбить API всей пачкой
+        self._paused_until = 0.0
+        # Через сколько освободится ближайший упёршийся в лимит чат
+        self._throttle_wait: Optional[float] = None
+
+    # -------------------------------------------------
+    # Постановка в очередь
+
+    @staticmethod
+    def enqueue(chat_id: int, text: str, priority: int = PRIORITY_BOOKING) -> NotificationOutbox:
+        """Добавляет сообщение в текущую сессию БД (коммит — на вызывающем)"""
+        item = NotificationOutbox(chat_id=chat_id, text=text, priority=priority)
+        db.session.add(item)
+        return item
+
+    def wake(self) -> None:
+        """Будит диспетчер после коммита; при необходимости запускает его"""
+        self.start()
+        self._wakeup.set()
+
+    # -------------------------------------------------
+    # Жизненный цикл потока
+
+    def start(self) -> None:
+        with self._lock:
+            # После fork поток родителя в дочернем процессе не существует
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._http = None
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="vrzone-notifier", daemon=True
+            )
+            self._thread.start()
+            self.logger.info("Диспетчер уведомлений запущен")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                self._stopping.wait(pause)
+                continue
+
+            try:
+                with self.app.app_context():
+                    processed = self.drain_once()
+            except Exception:
+                self.logger.exception("Ошибка диспетчера уведомлений")
+                processed = 0
+            self._maybe_purge()
+            # Метрики отправки видны /metrics других воркеров и без входящих запросов
+            REGISTRY.maybe_dump()
+
+            # Полная пачка — возможно, есть ещё; иначе ждём сигнала или таймаута
+            if processed < self.batch_size:
+                timeout = self.poll_interval
+                if self._throttle_wait is not None:
+                    timeout = min(timeout, self._throttle_wait)
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+
+    # -------------------------------------------------
+    # Обработка очереди
+
+    def drain_once(self) -> int:
+        """Забирает и отправляет одну пачку готовых сообщений.
+
+        Должен вызываться внутри app context. Возвращает число
+        обработанных записей.
+        """
+        now = datetime.utcnow()
+        outbox = NotificationOutbox
+        # Чаты, упёршиеся в лимит, отсекаются в SQL, а от каждого чата берётся
+        # не больше его запаса: очередь одного шумного чата не вытесняет из
+        # пачки сообщения в свободные чаты
+        ready = db.or_(
+            ChatThrottle.allowed_at.is_(None),
+            db.and_(
+                outbox.chat_id < 0,
+                ChatThrottle.allowed_at <= now + timedelta(seconds=burst_allowance(*GROUP_CHAT_LIMITS)),
+            ),
+            db.and_(
+                outbox.chat_id >= 0,
+                ChatThrottle.allowed_at <= now + timedelta(seconds=burst_allowance(*PRIVATE_CHAT_LIMITS)),
+            ),
+        )
+        ranked = (
+            db.select(
+                outbox.id,
+                outbox.chat_id,
+                outbox.text,
+                outbox.priority,
+                db.func.row_number()
+                .over(partition_by=outbox.chat_id, order_by=(outbox.priority, outbox.id))
+                .label("rank"),
+            )
+            .outerjoin(ChatThrottle, ChatThrottle.chat_id == outbox.chat_id)
+            .where(outbox.status == "pending", outbox.next_attempt_at <= now, ready)
+            .subquery()
+        )
+        per_chat = max(PRIVATE_CHAT_LIMITS[1], GROUP_CHAT_LIMITS[1])
+        candidates = db.session.execute(
+            db.select(ranked.c.id, ranked.c.chat_id, ranked.c.text)
+            .where(ranked.c.rank <= per_chat)
+            .order_by(ranked.c.priority, ranked.c.id)
+            .limit(self.batch_size)
+        ).all()
+        # Закрываем читающую транзакцию: каждая аренда — отдельная запись
+        db.session.commit()
+
+        processed = 0
+        self._throttle_wait = None
+        throttled = set()
+        for item_id, chat_id, text in candidates:
+            if chat_id in throttled:
+                continue
+            claimed, wait = self._claim(item_id, chat_id)
+            if wait:
+                # Чат упёрся в лимит — сообщения остаются в очереди до следующего прохода
+                throttled.add(chat_id)
+                self._throttle_wait = wait if self._throttle_wait is None else min(self._throttle_wait, wait)
+                continue
+            if not claimed:
+                continue
+            processed += 1
+            started = time.perf_counter()
+            ok, retry_after, error, permanent = self._deliver(chat_id, text)
+            TELEGRAM_SEND.observe(
+                time.perf_counter() - started,
+                "outbox",
+                "sendMessage",
+                self._outcome(ok, retry_after, permanent),
+            )
+            self._record_result(item_id, ok, retry_after, error, permanent)
+            if retry_after is not None:
+                self._pause_chat(chat_id, retry_after)
+                self._paused_until = time.monotonic() + retry_after
+                break
+
+        return processed
+
+    def _maybe_purge(self) -> None:
+        if self.retention is None or time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + self.purge_interval
+        try:
+            with self.app.app_context():
+                removed = self.purge_sent()
+        except Exception:
+            self.logger.exception("Ошибка очистки outbox")
+            return
+        if removed:
+            self.logger.info(f"Outbox: удалено {removed} отправленных сообщений")
+
+    def purge_sent(self, now: Optional[datetime] = None, batch_size: int = 1000) -> int:
+        """Удаляет отправленные сообщения старше `retention`, пачками.
+
+        Каждая пачка — короткая транзакция записи, брони между ними не ждут.
+        Для отправленной записи next_attempt_at — момент аренды перед
+        отправкой, поэтому условие идёт диапазоном по ix_outbox_status_next.
+        """
+        cutoff = (now or datetime.utcnow()) - self.retention
+        removed = 0
+        while True:
+            expired = (
+                db.select(NotificationOutbox.id)
+                .where(
+                    NotificationOutbox.status == "sent",
+                    NotificationOutbox.next_attempt_at < cutoff,
+                )
+                .limit(batch_size)
+            )
+            begin_immediate()
+            result = db.session.execute(
+                db.delete(NotificationOutbox).where(NotificationOutbox.id.in_(expired))
+            )
+            db.session.commit()
+            removed += result.rowcount
+            if result.rowcount < batch_size:
+                return removed
+
+    def _claim(self, item_id: int, chat_id: int) -> Tuple[bool, float]:
+        """Арендует запись на `lease` секунд и занимает место в лимите её чата.
+
+        Аренда и лимит (ChatThrottle) — одна транзакция записи, поэтому
+        лимит чата общий для всех воркеров gunicorn, а не свой у каждого.
+        Возвращает (арендована ли, сколько ждать): (False, >0) — чат
+        упёрся в лимит, (False, 0) — запись уже взял другой воркер.
+        Если процесс упадёт во время отправки, аренда истечёт и
+        сообщение будет отправлено повторно. Аренда отсчитывается от
+        момента захвата, а не от начала пачки: отправка каждого
+        сообщения может занять до ~13 с, и к концу пачки аренда «от
+        начала» уже истекла бы — запись взял бы второй диспетчер.
+        """
+        rate, capacity = chat_limits(chat_id)
+        interval = timedelta(seconds=1 / rate)
+        burst = timedelta(seconds=burst_allowance(rate, capacity))
+
+        begin_immediate()
+        current = datetime.utcnow()
+        allowed_at = db.session.scalar(
+            db.select(ChatThrottle.allowed_at).where(ChatThrottle.chat_id == chat_id)
+        )
+        allowed_at = max(allowed_at or current, current)
+        if allowed_at - burst > current:
+            db.session.rollback()
+            return False, (allowed_at - burst - current).total_seconds()
+
+        result = db.session.execute(
+            db.update(NotificationOutbox)
+            .where(
+                NotificationOutbox.id == item_id,
+                NotificationOutbox.status == "pending",
+                NotificationOutbox.next_attempt_at <= current,
+            )
+            .values(next_attempt_at=current + timedelta(seconds=self.lease))
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            return False, 0.0
+        self._set_allowed_at(chat_id, allowed_at + interval)
+        db.session.commit()
+        return True, 0.0
+
+    def _pause_chat(self, chat_id: int, seconds: float) -> None:
+        """429 retry_after: чат молчит `seconds` во всех воркерах"""
+        burst = timedelta(seconds=burst_allowance(*chat_limits(chat_id)))
+        begin_immediate()
+        self._set_allowed_at(chat_id, datetime.utcnow() + timedelta(seconds=seconds) + burst)
+        db.session.commit()
+
+    @staticmethod
+    def _set_allowed_at(chat_id: int, allowed_at: datetime) -> None:
+        stmt = sqlite_insert(ChatThrottle).values(chat_id=chat_id, allowed_at=allowed_at)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ChatThrottle.chat_id],
+                set_={"allowed_at": stmt.excluded.allowed_at},
+            )
+        )
+
+    def _record_result(
+        self,
+        item_id: int,
+        ok: bool,
+        retry_after: Optional[float],
+        error: str,
+        permanent: bool,
+    ) -> None:
+        begin_immediate()
+        item = db.session.get(NotificationOutbox, item_id)
+        if item is None:
+            return
+
+        if ok:
+            item.status = "sent"
+            item.sent_at = datetime.utcnow()
+            item.last_error = None
+            self.logger.info("Сообщение отправлено в Telegram")
+        else:
+            item.attempts += 1
+            item.last_error = error
+            if permanent or item.attempts >= self.max_attempts:
+                item.status = "dead"
+                self.logger.error(
+                    f"Уведомление {item.id} отброшено после {item.attempts} попыток: {error}"
+                )
+            else:
+                delay = self._backoff(item.attempts)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                item.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                self.logger.warning(
+                    f"Telegram ошибка (попытка {item.attempts}), "
+                    f"повтор через {delay:.0f} с: {error}"
+                )
+        db.session.commit()
+
+    @staticmethod
+    def _outcome(ok: bool, retry_after: Optional[float], permanent: bool) -> str:
+        if ok:
+            return "ok"
+        if retry_after is not None:
+            return "retry_after"
+        return "rejected" if permanent else "error"
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return random.uniform(delay / 2, delay)
+
+    # -------------------------------------------------
+    # HTTP
+
+    def _session(self) -> requests.Session:
+        if self._http is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._http = session
+        return self._http
+
+    def _deliver(self, chat_id: int, text: str) -> Tuple[bool, Optional[float], str, bool]:
+        """Отправляет сообщение: (ok, retry_after, ошибка, неисправимая ли ошибка)"""
+        url = f"{self.api_url}/bot{self.bot_token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
+
+        try:
+            r = self._session().post(url, data=payload, timeout=(3.05, 10))
+        except requests.RequestException as e:
+            return False, None, f"{type(e).__name__}: {e}", False
+
+        if r.ok:
+            return True, None, "", False
+
+        retry_after = None
+        try:
+            retry_after = r.json().get("parameters", {}).get("retry_after")
+        except ValueError:
+            pass
+
+        error = f"{r.status_code} {r.text[:500]}"
+        # 429 и 5xx — временные; остальные 4xx (чат не найден, бот заблокирован) — нет
+        permanent = 400 <= r.status_code < 500 and r.status_code != 429
+        return False, retry_after, error, permanent
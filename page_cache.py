@@ -0,0 +1,120 @@
+# page_cache.py
+import gzip
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from flask import Response, render_template, request, session
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    brotli = None
+
+
+class CachedPage:
+    """Отрендеренная страница и её заранее сжатые варианты"""
+
+    __slots__ = ("variants",)
+
+    def __init__(self, body: bytes):
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # encoding -> (тело, ETag); у каждого представления свой сильный ETag
+        self.variants = {"identity": (body, digest)}
+        self.variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), digest + "-gz")
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=11), digest + "-br")
+
+
+class PageCache:
+    """Кэш целых HTML-страниц для статичных маршрутов.
+
+    Страница рендерится один раз и хранится в памяти вместе с gzip/brotli
+    вариантами. Запросы с If-None-Match получают 304. Если в сессии есть
+    flash-сообщения, страница рендерится как обычно и не кэшируется —
+    такое состояние принадлежит одному пользователю.
+
+    Кэш живёт в памяти процесса, поэтому деплой сбрасывает его сам;
+    изменения шаблонов на диске отслеживаются по mtime не чаще, чем
+    раз в `check_interval` секунд.
+    """
+
+    def __init__(self, app, logger, enabled: bool = True, check_interval: float = 2.0):
+        self.app = app
+        self.logger = logger
+        self.enabled = enabled
+        self.check_interval = check_interval
+
+        self._pages: Dict[str, CachedPage] = {}
+        self._lock = threading.Lock()
+        self._templates_mtime = self._scan_templates()
+        self._next_check = time.monotonic() + check_interval
+
+    # -------------------------------------------------
+
+    def render(self, template_name: str) -> Response:
+        if not self.enabled or "_flashes" in session:
+            return Response(render_template(template_name), mimetype="text/html")
+
+        self._check_templates()
+        page = self._pages.get(template_name)
+        if page is None:
+            page = CachedPage(render_template(template_name).encode("utf-8"))
+            with self._lock:
+                self._pages[template_name] = page
+
+        encoding = self._negotiate(page)
+        body, etag = page.variants[encoding]
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype="text/html")
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+
+        response.set_etag(etag)
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+
+    # -------------------------------------------------
+
+    @staticmethod
+    def _negotiate(page: CachedPage) -> str:
+        accepted = request.accept_encodings
+        for encoding in ("br", "gzip"):
+            if encoding in page.variants and accepted[encoding]:
+                return encoding
+        return "identity"
+
+    def _scan_templates(self) -> Optional[float]:
+        folder = os.path.join(self.app.root_path, self.app.template_folder or "templates")
+        try:
+            return max(
+                (entry.stat().st_mtime for entry in os.scandir(folder) if entry.is_file()),
+                default=None,
+            )
+        except OSError:
+            return None
+
+    def _check_templates(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+
+        mtime = self._scan_templates()
+        if mtime != self._templates_mtime:
+            self._templates_mtime = mtime
+            # Без auto_reload Jinja держит старые шаблоны в своём кэше
+            if self.app.jinja_env.cache is not None:
+                self.app.jinja_env.cache.clear()
+            self.clear()
+            self.logger.info("Шаблоны изменились — кэш страниц сброшен")
@@ -0,0 +1,25 @@
+# phones.py
+import re
+from typing import Optional
+
+
+def normalize_phone(phone: str) -> Optional[str]:
+    """Канонический номер в E.164: '8 777 123-45-67' -> '+77771234567'.
+
+    None, если цифр меньше десяти. Локальные форматы (10 цифр, ведущая
+    8) приводятся к коду +7; номер с явным «+» уже международный
+    ('+49 30 123456' -> '+4930123456') и не переписывается.
+
+    Отдельный модуль без зависимостей: его импортируют и веб-приложение,
+    и бот, которому не нужен весь стек Flask.
+    """
+    digits = re.sub(r"\D", "", phone)
+    if len(digits) < 10:
+        return None
+    if phone.strip().startswith("+"):
+        return "+" + digits
+    if len(digits) == 10:
+        digits = "7" + digits
+    elif len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return "+" + digits
@@ -0,0 +1,268 @@
+# reminders.py
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+from html import escape
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from metrics import REGISTRY
+from models import db, Booking, BookingReminder, Client, begin_immediate
+from scheduler import PRIORITY_REMINDER
+
+REMINDERS = REGISTRY.counter(
+    "vrzone_reminders",
+    "Напоминания о сеансе по исходу",
+    labels=("outcome",),
+)
+
+
+def parse_offsets(value: Optional[str], default: str = "120,15") -> List[int]:
+    """'120,15' -> [120, 15] минут до начала. Пустая строка или '0' — напоминания выключены"""
+    value = default if value is None else value.strip()
+    if value in ("", "0"):
+        return []
+    try:
+        offsets = sorted({int(part) for part in value.split(",") if part.strip()}, reverse=True)
+    except ValueError:
+        raise RuntimeError(f"REMINDER_OFFSETS — минуты через запятую, получено: '{value}'")
+    if any(offset <= 0 for offset in offsets):
+        raise RuntimeError(f"REMINDER_OFFSETS должны быть положительными, получено: '{value}'")
+    return offsets
+
+
+def _humanize(minutes: int) -> str:
+    hours, rest = divmod(minutes, 60)
+    if hours and rest:
+        return f"{hours} ч {rest} мин"
+    return f"{hours} ч" if hours else f"{rest} мин"
+
+
+class ReminderScheduler:
+    """Напоминания клиентам перед сеансом (например, за 2 ч и за 15 мин).
+
+    В памяти — min-heap (время отправки, бронь, интервал) только для
+    ближайшего окна `window`. Окно дочитывается диапазоном по индексу
+    ix_booking_start_at, новые брони — по id > последнего виденного,
+    так что стоимость не зависит от размера истории. Отменённые или
+    перенесённые брони отсеиваются при извлечении из кучи.
+
+    Отправка — через outbox: отметка BookingReminder и сообщение пишутся
+    одной транзакцией, лимиты на чат и повторы берёт на себя диспетчер.
+    """
+
+    def __init__(
+        self,
+        app,
+        notifier,
+        logger,
+        offsets: Sequence[int] = (120, 15),
+        window: timedelta = timedelta(hours=6),
+        grace: timedelta = timedelta(minutes=10),
+        poll_interval: float = 30.0,
+        batch_size: int = 50,
+        clock: Callable[[], datetime] = datetime.now,
+    ):
+        self.app = app
+        self.notifier = notifier
+        self.logger = logger
+        self.offsets = sorted(offsets, reverse=True)
+        self.window = window
+        # Напоминание, опоздавшее больше чем на grace (простой сервиса), уже не отправляем
+        self.grace = grace
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        # Местное время площадки (VRZoneBaseApp.venue_now): start_at — время из формы
+        self.clock = clock
+
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._queued: Set[Tuple[int, int]] = set()
+        self._horizon: Optional[datetime] = None
+        self._last_id = 0
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------
+    # Жизненный цикл потока
+
+    def start(self) -> None:
+        if not self.offsets:
+            return
+        with self._lock:
+            # После fork поток родителя в дочернем процессе не существует
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._heap, self._queued = [], set()
+            self._horizon, self._last_id = None, 0
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="vrzone-reminders", daemon=True
+            )
+            self._thread.start()
+            self.logger.info("Планировщик напоминаний запущен")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self) -> None:
+        """Новая бронь: подхватить её, не дожидаясь poll_interval"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    self.tick()
+            except Exception:
+                self.logger.exception("Ошибка планировщика напоминаний")
+
+            timeout = self.poll_interval
+            if self._heap:
+                until_next = (self._heap[0][0] - self.clock()).total_seconds()
+                timeout = min(timeout, max(until_next, 0.0))
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    # -------------------------------------------------
+    # Очередь
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """Один проход: дочитать окно и новые брони, отправить созревшие.
+
+        Должен вызываться внутри app context. Возвращает число
+        поставленных в outbox напоминаний.
+        """
+        now = now or self.clock()
+        # Оба чтения — в одной транзакции, чтобы бронь не проскочила между ними
+        if self._horizon is not None:
+            self._load_new(now)
+        if self._horizon is None or now + self.window / 2 >= self._horizon:
+            self._load_window(now)
+        db.session.commit()
+
+        queued = 0
+        while self._heap and self._heap[0][0] <= now:
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                due, booking_id, offset = heapq.heappop(self._heap)
+                self._queued.discard((booking_id, offset))
+                batch.append((due, booking_id, offset))
+            queued += self._send_batch(batch, now)
+        if queued:
+            self.notifier.wake()
+        return queued
+
+    def _push(self, booking_id: int, start_at: datetime, now: datetime) -> None:
+        for offset in self.offsets:
+            due = start_at - timedelta(minutes=offset)
+            key = (booking_id, offset)
+            if due < now - self.grace or key in self._queued:
+                continue
+            heapq.heappush(self._heap, (due, booking_id, offset))
+            self._queued.add(key)
+
+    def _upcoming(self, *conditions):
+        booking = Booking.__table__
+        return (
+            db.select(booking.c.id, booking.c.start_at)
+            .where(booking.c.start_at.isnot(None), *conditions)
+        )
+
+    def _load_window(self, now: datetime) -> None:
+        """Дочитывает брони, начинающиеся до now + window (диапазон по индексу start_at)"""
+        horizon = now + self.window
+        # Нижняя граница: самое раннее напоминание, которое ещё не опоздало
+        lower = self._horizon or now - self.grace
+        booking = Booking.__table__
+        rows = db.session.execute(
+            self._upcoming(booking.c.start_at > lower, booking.c.start_at <= horizon)
+        ).all()
+        last_id = db.session.scalar(db.select(db.func.max(booking.c.id))) or 0
+
+        for booking_id, start_at in rows:
+            self._push(booking_id, start_at, now)
+        self._horizon = horizon
+        self._last_id = max(self._last_id, last_id)
+
+    def _load_new(self, now: datetime) -> None:
+        """Брони, созданные после последнего прохода (диапазон по первичному ключу)"""
+        booking = Booking.__table__
+        rows = db.session.execute(
+            self._upcoming(booking.c.id > self._last_id).order_by(booking.c.id)
+        ).all()
+
+        for booking_id, start_at in rows:
+            self._last_id = max(self._last_id, booking_id)
+            # Брони дальше горизонта подхватит следующая дочитка окна
+            if start_at <= self._horizon:
+                self._push(booking_id, start_at, now)
+
+    # -------------------------------------------------
+    # Отправка
+
+    def _send_batch(self, batch, now: datetime) -> int:
+        """Ставит пачку напоминаний в outbox одной транзакцией"""
+        ids = {booking_id for _, booking_id, _ in batch}
+        begin_immediate()
+        current = {
+            row.id: row
+            for row in db.session.execute(
+                db.select(Booking.id, Booking.start_at, Booking.duration, Client.telegram_user_id)
+                .join(Client, Client.id == Booking.client_id, isouter=True)
+                .where(Booking.id.in_(ids))
+            )
+        }
+
+        queued = 0
+        for due, booking_id, offset in batch:
+            row = current.get(booking_id)
+            if row is None or row.start_at is None:
+                REMINDERS.inc("cancelled")
+                continue
+            actual_due = row.start_at - timedelta(minutes=offset)
+            if actual_due != due:
+                # Бронь перенесли — ставим напоминание на новое время
+                if actual_due > now:
+                    heapq.heappush(self._heap, (actual_due, booking_id, offset))
+                    self._queued.add((booking_id, offset))
+                    continue
+                if actual_due < now - self.grace:
+                    REMINDERS.inc("late")
+                    continue
+            if not row.telegram_user_id:
+                REMINDERS.inc("no_chat")
+                continue
+
+            claimed = db.session.execute(
+                sqlite_insert(BookingReminder)
+                .values(booking_id=booking_id, offset_minutes=offset)
+                .on_conflict_do_nothing()
+                .returning(BookingReminder.booking_id)
+            ).first()
+            if claimed is None:
+                # Уже отправлено (другим воркером или до перезапуска)
+                REMINDERS.inc("duplicate")
+                continue
+
+            self.notifier.enqueue(
+                row.telegram_user_id,
+                f"⏰ <b>Напоминание VR ZONE</b>\n\n"
+                f"Ваш сеанс начнётся через {_humanize(offset)}, "
+                f"в {row.start_at.strftime('%H:%M')} ({row.start_at.strftime('%d.%m')}).\n"
+                f"🎮 {escape(row.duration)}",
+                priority=PRIORITY_REMINDER,
+            )
+            REMINDERS.inc("sent")
+            queued += 1
+        db.session.commit()
+        return queued
@@ -0,0 +1,236 @@
+# scheduler.py
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("VRZone.scheduler")
+
+# Приоритеты сообщений админу: меньше — важнее
+PRIORITY_BOOKING = 0
+PRIORITY_CONTACT = 1
+PRIORITY_REMINDER = 1
+PRIORITY_CHATTER = 2
+
+# Лимит длины сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Классический token bucket: `rate` сообщений в секунду, запас `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Берёт токен, если он есть, и возвращает 0; иначе — сколько ждать"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Обнуляет запас на `seconds` (после 429 retry_after)"""
+        with self._lock:
+            self.tokens = -seconds * self.rate
+            self.updated = time.monotonic()
+
+
+# Лимиты Telegram (сообщений в секунду, запас): ~1/с в личный чат, ~20/мин в группу
+PRIVATE_CHAT_LIMITS = (1.0, 3)
+GROUP_CHAT_LIMITS = (20 / 60, 5)
+
+
+def chat_limits(chat_id: int) -> Tuple[float, float]:
+    return GROUP_CHAT_LIMITS if chat_id < 0 else PRIVATE_CHAT_LIMITS
+
+
+def burst_allowance(rate: float, capacity: float) -> float:
+    """На сколько секунд allowed_at (GCRA) может опережать «сейчас», пока запас не исчерпан"""
+    return (capacity - 1) / rate
+
+
+def bucket_for_chat(chat_id: int) -> TokenBucket:
+    rate, capacity = chat_limits(chat_id)
+    return TokenBucket(rate=rate, capacity=capacity)
+
+
+class ChatBuckets:
+    """Token bucket на каждый чат, создаются по требованию"""
+
+    def __init__(self, factory: Callable[[int], TokenBucket] = bucket_for_chat):
+        self.factory = factory
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(chat_id, self.factory(chat_id))
+        return bucket
+
+
+class AdminMessageScheduler:
+    """Очередь отправки сообщений для aiogram-ботов.
+
+    Сообщения уходят по приоритету (брони раньше болтовни) с учётом
+    token bucket на чат. Если к моменту отправки в очереди скопилось
+    несколько сообщений низкого приоритета для того же чата, они
+    склеиваются в одну сводку. На 429 чат ставится на паузу на
+    retry_after, сообщение возвращается в очередь.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int, str], Awaitable],
+        retry_after_of: Callable[[Exception], Optional[float]] = lambda e: None,
+        coalesce_from: int = PRIORITY_CHATTER,
+        max_queue: int = 10_000,
+        max_attempts: int = 5,
+    ):
+        self.send = send
+        self.retry_after_of = retry_after_of
+        self.coalesce_from = coalesce_from
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+
+        self.buckets = ChatBuckets()
+        self._queue: List[list] = []
+        self._seq = itertools.count()
+        self._ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dropped = 0
+
+    # -------------------------------------------------
+
+    def submit(self, chat_id: int, text: str, priority: int = PRIORITY_CHATTER) -> None:
+        if len(self._queue) >= self.max_queue:
+            self._drop_lowest()
+        heapq.heappush(self._queue, [priority, next(self._seq), chat_id, text, 0])
+        if self._ready is not None:
+            self._ready.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="admin-scheduler")
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """Пытается дослать очередь, затем останавливает воркер"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + drain_timeout
+        while self._queue and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._queue:
+            logger.warning(f"Не отправлено при остановке: {len(self._queue)} сообщений")
+
+    # -------------------------------------------------
+
+    def _drop_lowest(self) -> None:
+        # Переполнение: выкидываем самое неважное и самое старое, считаем в сводку
+        victim = max(self._queue, key=lambda item: (item[0], -item[1]))
+        self._queue.remove(victim)
+        heapq.heapify(self._queue)
+        self._dropped += 1
+
+    def _next_ready(self):
+        """Первое по приоритету сообщение, чат которого не упёрся в лимит.
+
+        Возвращает (элемент, 0) или (None, сколько ждать до ближайшего токена).
+        """
+        wait = None
+        blocked = set()
+        for item in sorted(self._queue):
+            chat_id = item[2]
+            if chat_id in blocked:
+                continue
+            delay = self.buckets[chat_id].reserve()
+            if delay == 0:
+                return item, 0.0
+            blocked.add(chat_id)
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _take(self, item) -> str:
+        """Убирает элемент из очереди; низкий приоритет склеивает в сводку"""
+        self._queue.remove(item)
+        priority, _, chat_id, text, _ = item
+        if priority < self.coalesce_from:
+            heapq.heapify(self._queue)
+            return text
+
+        batch = [text]
+        size = len(text)
+        for other in sorted(self._queue):
+            if other[2] != chat_id or other[0] < self.coalesce_from:
+                continue
+            if size + len(other[3]) + 2 > MAX_MESSAGE_LENGTH - 100:
+                break
+            batch.append(other[3])
+            size += len(other[3]) + 2
+            self._queue.remove(other)
+        heapq.heapify(self._queue)
+
+        dropped, self._dropped = self._dropped, 0
+        if len(batch) == 1 and not dropped:
+            return text
+        header = f"📨 Сводка: {len(batch)} сообщений"
+        if dropped:
+            header += f" (ещё {dropped} пропущено из-за перегрузки)"
+        return header + "\n\n" + "\n\n".join(batch)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            item, wait = self._next_ready()
+            if item is None:
+                self._ready.clear()
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            priority, seq, chat_id, _, attempts = item
+            text = self._take(item)
+            try:
+                await self.send(chat_id, text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                retry_after = self.retry_after_of(e)
+                if retry_after is not None:
+                    # 429 — не ошибка сообщения, попытку не засчитываем
+                    self.buckets[chat_id].pause(retry_after)
+                    logger.warning(f"Лимит Telegram для чата {chat_id}, пауза {retry_after} с")
+                else:
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        logger.error(f"Сообщение в чат {chat_id} отброшено: {e}")
+                        continue
+                    logger.warning(f"Ошибка отправки в чат {chat_id} (попытка {attempts}): {e}")
+                # Возвращаем с исходным порядковым номером — не теряем место в очереди
+                heapq.heappush(self._queue, [priority, seq, chat_id, text, attempts])
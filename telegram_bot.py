@@ -3,6 +3,7 @@ import logging
 import os
 
 from aiogram import Bot, Dispatcher, F
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.filters import CommandStart, Command
 from aiogram.types import (
     Message,
@@ -13,6 +14,11 @@ from aiogram.types import (
 )
 from dotenv import load_dotenv
 
+from bot_metrics import TelegramCallMetrics, UpdateMetrics, serve_metrics
+from contacts import ContactStore
+from scheduler import AdminMessageScheduler, PRIORITY_CHATTER, PRIORITY_CONTACT
+from webhook import WebhookServer
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -35,6 +41,20 @@ try:
 except ValueError:
     raise ValueError(f"ADMIN_CHAT_ID должен быть числом! Получено: '{ADMIN_CHAT_ID_STR}'")
 
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")  # публичный https-адрес; без него setWebhook не вызывается
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "16"))
+# /metrics в режиме polling (в режиме webhook — на WEBHOOK_PORT)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"BOT_MODE должен быть polling или webhook, получено: '{BOT_MODE}'")
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET не задан в .env (нужен для режима webhook)")
+
 logger.info(f"ADMIN_CHAT_ID = {ADMIN_CHAT_ID}")
 
 # Клиентский бот
@@ -45,6 +65,20 @@ admin_bot = Bot(token=ADMIN_BOT_TOKEN)
 
 dp = Dispatcher()
 
+# Метрики: время вызовов Bot API и обработки обновлений
+client_bot.session.middleware(TelegramCallMetrics("client_bot"))
+admin_bot.session.middleware(TelegramCallMetrics("admin_bot"))
+dp.update.outer_middleware(UpdateMetrics({client_bot.id: "client", admin_bot.id: "admin"}))
+
+# Общая с веб-приложением БД: телефон -> Telegram user_id
+contacts = ContactStore.from_env()
+
+# Все сообщения админу — через очередь с лимитами на чат и сводками
+admin_scheduler = AdminMessageScheduler(
+    send=admin_bot.send_message,
+    retry_after_of=lambda e: e.retry_after if isinstance(e, TelegramRetryAfter) else None,
+)
+
 
 # Клавиатура "Поделиться номером"
 share_kb = ReplyKeyboardMarkup(
@@ -93,6 +127,27 @@ async def handle_contact(message: Message):
     user_id = message.from_user.id
     first_name = message.from_user.first_name or "Клиент"
 
+    # Привязываем только собственный номер, а не пересланный чужой контакт
+    if contact.user_id != user_id:
+        await message.answer(
+            "Пожалуйста, поделитесь своим номером кнопкой ниже.",
+            reply_markup=share_kb
+        )
+        return
+
+    try:
+        client_id = await contacts.link(phone, user_id, first_name)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения контакта: {e}")
+        client_id = None
+
+    if client_id is None:
+        await message.answer(
+            "Не удалось сохранить номер. Попробуйте ещё раз позже.",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        return
+
     await message.answer(
         f"Спасибо, {first_name}! ✅\n"
         f"Ваш номер {phone} сохранён.\n"
@@ -106,7 +161,8 @@ async def handle_contact(message: Message):
         f"Имя: {first_name}\n"
         f"Телефон: {phone}\n"
         f"User ID: {user_id}\n"
-        f"Username: @{message.from_user.username or 'нет'}"
+        f"Username: @{message.from_user.username or 'нет'}",
+        priority=PRIORITY_CONTACT
     )
 
 
@@ -125,23 +181,54 @@ async def _forward_to_admin(message: Message):
         elif message.contact:
             text += f"Контакт: {message.contact.phone_number} ({message.contact.first_name})"
 
-        await admin_bot.send_message(ADMIN_CHAT_ID, text)
-        logger.info("Сообщение переслано админу")
+        admin_scheduler.submit(ADMIN_CHAT_ID, text, PRIORITY_CHATTER)
+        logger.info("Сообщение поставлено в очередь пересылки админу")
     except Exception as e:
         logger.error(f"Ошибка пересылки админу: {e}")
 
 
-async def _notify_admin(text: str):
-    try:
-        await admin_bot.send_message(ADMIN_CHAT_ID, text)
-        logger.info("Уведомление отправлено админу")
-    except Exception as e:
-        logger.error(f"Ошибка отправки уведомления админу: {e}")
+async def _notify_admin(text: str, priority: int = PRIORITY_CHATTER):
+    admin_scheduler.submit(ADMIN_CHAT_ID, text, priority)
+    logger.info("Уведомление поставлено в очередь админу")
+
+
+async def _shutdown():
+    await admin_scheduler.stop()
+    await contacts.close()
+
+
+async def run_webhook():
+    # Оба бота в одном процессе: отдельный polling-контейнер для админ-бота не нужен
+    server = WebhookServer(
+        dp,
+        bots={"client": client_bot, "admin": admin_bot},
+        secret=WEBHOOK_SECRET,
+        base_url=WEBHOOK_BASE_URL,
+        concurrency=WEBHOOK_CONCURRENCY,
+    )
+
+    async def on_startup():
+        admin_scheduler.start()
+
+    server.on_startup.append(on_startup)
+    server.on_shutdown.append(_shutdown)
+    await server.serve(port=WEBHOOK_PORT)
 
 
 async def main():
-    logger.info("Клиентский бот VR_ZONA запущен")
-    await dp.start_polling(client_bot)
+    logger.info(f"Клиентский бот VR_ZONA запущен (режим: {BOT_MODE})")
+    if BOT_MODE == "webhook":
+        await run_webhook()
+        return
+
+    admin_scheduler.start()
+    metrics_runner = await serve_metrics("0.0.0.0", METRICS_PORT) if METRICS_PORT else None
+    try:
+        await dp.start_polling(client_bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await _shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+# webhook.py
+import asyncio
+import hmac
+import logging
+import signal
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from bot_metrics import metrics_view
+
+logger = logging.getLogger("VRZone.webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Приём обновлений Telegram по webhook вместо long polling.
+
+    Один aiohttp-процесс обслуживает несколько ботов: обновления для
+    бота `name` приходят на POST /webhook/<name>. Запрос подтверждается
+    сразу после постановки в ограниченную очередь, обработку ведут
+    `concurrency` воркеров. Если очередь переполнена, отвечаем 503 —
+    Telegram повторит доставку позже.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bots: Dict[str, Bot],
+        secret: str,
+        base_url: Optional[str] = None,
+        concurrency: int = 16,
+        queue_size: int = 1000,
+        drain_timeout: float = 10.0,
+    ):
+        self.dispatcher = dispatcher
+        self.bots = bots
+        self.secret = secret
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.drain_timeout = drain_timeout
+
+        self.on_startup: List[Callable[[], Awaitable]] = []
+        self.on_shutdown: List[Callable[[], Awaitable]] = []
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._closing = False
+
+    # -------------------------------------------------
+    # aiohttp-приложение
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/webhook/{name}", self._handle)
+        app.router.add_get("/healthz", self._health)
+        app.router.add_get("/metrics", metrics_view)
+        app.on_startup.append(self._startup)
+        app.on_shutdown.append(self._shutdown)
+        return app
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self._closing:
+            return web.Response(status=503)
+
+        bot = self.bots.get(request.match_info["name"])
+        if bot is None:
+            return web.Response(status=404)
+
+        supplied = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(supplied.encode(), self.secret.encode()):
+            logger.warning(f"Webhook с неверным секретом от {request.remote}")
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait((bot, update))
+        except asyncio.QueueFull:
+            logger.warning("Очередь обновлений переполнена — Telegram повторит доставку")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "queued": self._queue.qsize() if self._queue else 0,
+            "closing": self._closing,
+        })
+
+    # -------------------------------------------------
+    # Обработка
+
+    async def _worker(self) -> None:
+        while True:
+            bot, update = await self._queue.get()
+            try:
+                await self.dispatcher.feed_update(bot, update)
+            except Exception:
+                logger.exception(f"Ошибка обработки обновления {update.update_id}")
+            finally:
+                self._queue.task_done()
+
+    async def _startup(self, app: web.Application) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"webhook-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        for hook in self.on_startup:
+            await hook()
+
+        if self.base_url:
+            allowed = self.dispatcher.resolve_used_update_types()
+            for name, bot in self.bots.items():
+                await bot.set_webhook(
+                    f"{self.base_url}/webhook/{name}",
+                    secret_token=self.secret,
+                    allowed_updates=allowed,
+                    max_connections=self.concurrency,
+                )
+                logger.info(f"Webhook для бота '{name}' установлен")
+
+    async def _shutdown(self, app: web.Application) -> None:
+        # Новые обновления отклоняем (Telegram их передоставит), принятые — дорабатываем
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не обработано при остановке: {self._queue.qsize()} обновлений")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+        for hook in self.on_shutdown:
+            await hook()
+        for bot in self.bots.values():
+            await bot.session.close()
+
+    # -------------------------------------------------
+
+    async def serve(self, host: str = "0.0.0.0", port: int = 8080) -> None:
+        """Запускает сервер и ждёт SIGINT/SIGTERM для плавной остановки"""
+        runner = web.AppRunner(self.build_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Webhook-сервер слушает {host}:{port}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:  # Windows
+                pass
+        try:
+            await stop.wait()
+        finally:
+            await runner.cleanup()
@@ -0,0 +1,91 @@
+# webhook_check.py
+"""Локальная замена Telegram для проверки webhook-сервера.
+
+Шлёт на POST /webhook/<бот> то же, что прислал бы Telegram, и сверяет
+ответы: верное обновление с секретом — 200, неверный секрет — 401,
+битое тело — 400, неизвестный бот — 404, плюс GET /healthz.
+Сервер запускается без WEBHOOK_BASE_URL (setWebhook не вызывается):
+
+    BOT_MODE=webhook WEBHOOK_SECRET=local-secret python telegram_bot.py
+    python webhook_check.py --url http://127.0.0.1:8080 --secret local-secret
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List, Tuple
+
+import requests
+
+from webhook import SECRET_HEADER
+
+
+def sample_update(update_id: int, chat_id: int, text: str) -> dict:
+    """Минимальный Update с текстовым сообщением от пользователя в личке"""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Webhook", "username": "webhook_check"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Webhook"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+def run_checks(url: str, bot: str, secret: str, chat_id: int, text: str) -> List[Tuple[str, int, int]]:
+    """Возвращает [(проверка, ожидаемый статус, полученный статус)]"""
+    endpoint = f"{url.rstrip('/')}/webhook/{bot}"
+    update = sample_update(int(time.time()), chat_id, text)
+    good = {SECRET_HEADER: secret, "Content-Type": "application/json"}
+
+    cases = [
+        ("обновление с верным секретом", 200,
+         lambda: requests.post(endpoint, data=json.dumps(update), headers=good, timeout=5)),
+        ("неверный секрет", 401,
+         lambda: requests.post(endpoint, json=update, headers={SECRET_HEADER: secret + "x"}, timeout=5)),
+        ("без секрета", 401,
+         lambda: requests.post(endpoint, json=update, timeout=5)),
+        ("тело не JSON", 400,
+         lambda: requests.post(endpoint, data="not json", headers=good, timeout=5)),
+        ("JSON не Update", 400,
+         lambda: requests.post(endpoint, data=json.dumps({"update_id": "x"}), headers=good, timeout=5)),
+        ("неизвестный бот", 404,
+         lambda: requests.post(f"{url.rstrip('/')}/webhook/unknown", json=update, headers=good, timeout=5)),
+        ("GET /healthz", 200,
+         lambda: requests.get(f"{url.rstrip('/')}/healthz", timeout=5)),
+    ]
+    results = []
+    for name, expected, call in cases:
+        try:
+            status = call().status_code
+        except requests.RequestException:
+            status = 0
+        results.append((name, expected, status))
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Проверка webhook-сервера ботов")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="адрес webhook-сервера")
+    parser.add_argument("--bot", default="client", help="имя бота в пути /webhook/<bot>")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"), help="по умолчанию WEBHOOK_SECRET")
+    parser.add_argument("--chat-id", type=int, default=1, help="user/chat id в тестовом обновлении")
+    parser.add_argument("--text", default="/start", help="текст тестового сообщения")
+    args = parser.parse_args(argv)
+    if not args.secret:
+        parser.error("нужен --secret или WEBHOOK_SECRET")
+
+    failed = 0
+    for name, expected, status in run_checks(args.url, args.bot, args.secret, args.chat_id, args.text):
+        ok = status == expected
+        failed += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: ожидали {expected}, получили {status or 'нет ответа'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())